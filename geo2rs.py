@@ -1,88 +1,2166 @@
 import argparse
+import array
+import asyncio
+import bz2
 import calendar
+import concurrent.futures
+import contextlib
+import cProfile
 import csv
 import datetime
+import glob
+import gzip
+import hashlib
+import heapq
+import io
+import json
 import logging
+import math
+import os
+import pickle
+import pstats
+import queue
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
 from collections import OrderedDict
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 import fiona
 from shapely import geos, wkb
-from shapely.geometry import shape
+from shapely.geometry import MultiLineString, MultiPoint, MultiPolygon, box, mapping, shape
 
-def transform(file_name):
-    """Creates a CSV file with EWKB geometries. 
-    It will write the SRID (EPSG code) only if it is defined in the input file CRS. 
+# boto3 session and clients shared by all the functions, see get_client()
+client_settings = {'max_pool_connections': 10, 'session_options': {}, 'backend': None}
+clients = {}
+clients_lock = threading.Lock()
+
+# Names of the bounding box columns added by transform() with bbox_columns
+BBOX_COLUMNS = ('minx', 'miny', 'maxx', 'maxy')
+
+# Maximum size in bytes of a Redshift GEOMETRY value
+MAX_GEOMETRY_SIZE = 1048447
+
+# Minimum size in bytes of every part of an S3 multipart upload but the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+# Dimension of each geometry type, used to discard the lower dimension parts of a clipped geometry
+GEOMETRY_DIMENSIONS = {
+    'Point': 0, 'MultiPoint': 0, 
+    'LineString': 1, 'LinearRing': 1, 'MultiLineString': 1, 
+    'Polygon': 2, 'MultiPolygon': 2
+}
+
+# File extensions of the supported compressions
+COMPRESSION_EXTENSIONS = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+    'bzip2': '.bz2'
+}
+
+def configure_clients(max_pool_connections=10, **session_options):
+    """Configures the boto3 session and the connection pool of the shared clients.
+    The clients already created are discarded only if the settings change.
+
+    :param max_pool_connections: Maximum number of connections kept open by each client.
+                                 It should not be lower than the number of threads using it
+    :param session_options: Options for boto3.session.Session, e.g. profile_name or region_name
+    """
+    settings = {'max_pool_connections': max_pool_connections, 'session_options': session_options}
+    with clients_lock:
+        if any(client_settings[name] != value for name, value in settings.items()):
+            client_settings.update(settings)
+            clients.clear()
+
+def configure_backend(backend=None):
+    """Selects the backend that creates the clients used by all the functions, 
+    i.e. a geo2rs_local.LocalBackend to import without AWS. A backend is an object 
+    with a client(service_name) method returning an object with the same methods 
+    as the boto3 client that geo2rs calls.
+
+    :param backend: Backend, or None to use boto3
+    """
+    with clients_lock:
+        client_settings['backend'] = backend
+        clients.clear()
+
+def get_client(service_name):
+    """Gets a boto3 client shared by all the functions, creating it on first use.
+    Reusing the clients avoids resolving the credentials, the endpoints and 
+    opening new connections on every call. boto3 clients are thread safe.
+
+    :param service_name: AWS service, e.g. "s3" or "redshift-data"
+    :return: boto3 client, or the client of the backend, see configure_backend()
+    """
+    with clients_lock:
+        if service_name not in clients:
+            if client_settings['backend'] is not None:
+                clients[service_name] = client_settings['backend'].client(service_name)
+                return clients[service_name]
+            if 'session' not in clients:
+                clients['session'] = boto3.session.Session(**client_settings['session_options'])
+            clients[service_name] = clients['session'].client(
+                service_name,
+                config=Config(max_pool_connections=client_settings['max_pool_connections'])
+            )
+        return clients[service_name]
+
+def transform(file_name, engine="fiona", batch_size=65536, workers=1, keep_parts=False, parts=None,
+              compression=None, output_format="csv", state_file=None, id_field=None,
+              checkpoint=None, on_checkpoint=None, spatial_key=None, sort_memory=None,
+              bbox_columns=False, oversized=None, field_types=None, on_progress=None,
+              precision=None, simplify_tolerance=None, preserve_topology=False,
+              feature_count=None):
+    """Creates a CSV file with EWKB geometries.
+    It will write the SRID (EPSG code) only if it is defined in the input file CRS.
+    The input file is only opened once, the schema, CRS and feature count needed
+    by the rest of the import are captured while transforming it.
+
+    :param file_name: Input file in one of the supported geospatial formats
+    :param engine: "fiona" to process the features one by one or "arrow" to read
+                   them in columnar batches with pyogrio and encode the geometries
+                   with vectorized Shapely 2 functions. Both produce the same CSV file
+    :param batch_size: Number of features per batch
+    :param workers: Number of processes. The features are split in ranges
+                    and each range is transformed in its own process
+    :param keep_parts: If True, the CSV file for each range is kept as a separate file
+                       (each one with its own header row) instead of concatenating them
+    :param parts: Number of feature ranges (CSV parts). By default, one per process.
+                  Setting it implies keep_parts
+    :param compression: Compress the CSV files while they are written: "gzip", "zstd" or "bzip2".
+                        With Parquet, "gzip" or "zstd" are used as column compression codec
+    :param output_format: "csv" or "parquet". Parquet files store the geometries as EWKB
+                          binary and the properties as typed columns. Parquet parts cannot
+                          be concatenated, so they are always kept as separate files
+    :param state_file: CSV file with the feature hashes of the previous import. If set,
+                       only the features inserted or updated since then are written,
+                       see detect_changes(). Uses a single process
+    :param id_field: Property identifying the features when state_file is set
+    :param checkpoint: Dictionary where the metadata of each part is recorded as soon 
+                       as it is written. The parts already recorded are not transformed 
+                       again, see transform_parallel()
+    :param on_checkpoint: Function called without arguments after checkpoint is updated
+    :param spatial_key: Adds a spatial_key property with the Hilbert index of the center 
+                        of the bounding box of each geometry, see get_spatial_keys().
+                        True to use the extent of the input file or a 
+                        (minx, miny, maxx, maxy) extent, that must be the same for all 
+                        the files loaded into the same table
+    :param sort_memory: If set, the features are sorted by spatial key using up to this 
+                        memory in bytes for each sorted run, see sort_batches(). 
+                        Implies spatial_key and uses a single process
+    :param bbox_columns: If True, adds minx, miny, maxx and maxy properties with the 
+                         bounding box of each geometry
+    :param oversized: What to do with the geometries larger than the maximum size of 
+                      a Redshift GEOMETRY, see limit_geometry_size(): "split", "simplify" 
+                      or "file". By default, they are written as they are and COPY fails
+    :param field_types: Redshift data types of some properties, used for the Parquet 
+                        column types, see get_profiled_field_types()
+    :param on_progress: Function called with the progress events of the transform, 
+                        see get_progress_event()
+    :param precision: Size of the grid the coordinates are snapped to, in units of the 
+                      CRS (i.e. 1e-7 degrees or 0.01 metres), see quantize_geometry()
+    :param simplify_tolerance: If set, the geometries are simplified with this tolerance 
+                               in units of the CRS before encoding them
+    :param preserve_topology: If True, the simplification keeps the geometries valid 
+                              (slower), else Douglas-Peucker is used and small polygons
+                              may collapse
+    :param feature_count: Number of features of the input file, if it is already known.
+                          Only needed to split the features in ranges or report the progress,
+                          it is counted once if not set
+    :return: Dictionary with the metadata of the transformed file:
+             files (paths of the written files), parts (True if the files are parts to be
+             loaded together), schema (Fiona schema), crs, epsg and feature_count.
+             With state_file, also changes (inserted, updated, unchanged and deleted counts)
+             and deleted_file (CSV file with the ids of the deleted features).
+             With oversized, also the oversized counts and the oversized_file.
+             With precision, also quantized (vertices_removed and bytes_saved).
+             With simplify_tolerance, also simplification (vertices_before and 
+             vertices_removed)
+    """
+
+    output_file = get_output_file_name(file_name, compression, output_format)
+
+    if sort_memory:
+        spatial_key = spatial_key or True
+
+    if state_file or sort_memory:
+        # Every feature must be compared with the hashes of the previous import 
+        # or sorted with the rest of the features
+        metadata = transform_range(file_name, output_file, engine, batch_size,
+                                   compression=compression, output_format=output_format,
+                                   state_file=state_file, id_field=id_field,
+                                   spatial_key=spatial_key, sort_memory=sort_memory,
+                                   bbox_columns=bbox_columns, oversized=oversized,
+                                   field_types=field_types, on_progress=on_progress,
+                                   precision=precision, simplify_tolerance=simplify_tolerance,
+                                   preserve_topology=preserve_topology,
+                                   total=feature_count)
+        metadata['files'] = [output_file]
+        metadata['parts'] = False
+        return metadata
+
+    if workers > 1 or keep_parts or parts:
+        keep_parts = keep_parts or bool(parts) or output_format == "parquet"
+        return transform_parallel(file_name, output_file, engine, batch_size,
+                                  workers, keep_parts, parts, compression, output_format,
+                                  checkpoint, on_checkpoint, spatial_key, bbox_columns,
+                                  oversized, field_types, on_progress, precision,
+                                  simplify_tolerance, preserve_topology, feature_count)
+
+    metadata = transform_range(file_name, output_file, engine, batch_size,
+                               compression=compression, output_format=output_format,
+                               spatial_key=spatial_key, bbox_columns=bbox_columns,
+                               oversized=oversized, field_types=field_types,
+                               on_progress=on_progress, precision=precision,
+                               simplify_tolerance=simplify_tolerance,
+                               preserve_topology=preserve_topology, total=feature_count)
+    metadata['files'] = [output_file]
+    metadata['parts'] = False
+    return metadata
+
+def transform_range(file_name, output_file, engine="fiona", batch_size=65536,
+                    start=None, stop=None, header=True, compression=None, output_format="csv",
+                    state_file=None, id_field=None, spatial_key=None, sort_memory=None,
+                    bbox_columns=False, oversized=None, field_types=None, on_progress=None,
+                    precision=None, simplify_tolerance=None, preserve_topology=False,
+                    total=None):
+    """Creates a CSV or Parquet file with EWKB geometries for a range of features
+
+    :param file_name: Input file in one of the supported geospatial formats
+    :param output_file: Path of the file to write
+    :param engine: Transform engine, "fiona" or "arrow"
+    :param batch_size: Number of features per batch
+    :param start: Index of the first feature to transform
+    :param stop: Index after the last feature to transform
+    :param header: If True, writes the header row
+    :param compression: Compress the CSV file while it is written: "gzip", "zstd" or "bzip2"
+    :param output_format: "csv" or "parquet"
+    :param state_file: CSV file with the feature hashes of the previous import, see detect_changes()
+    :param id_field: Property identifying the features when state_file is set
+    :param spatial_key: True or extent to add a spatial_key property, see transform()
+    :param sort_memory: If set, sorts the features by spatial key, see sort_batches()
+    :param bbox_columns: If True, adds the bounding box properties, see transform()
+    :param oversized: Policy for the oversized geometries, see limit_geometry_size()
+    :param field_types: Redshift data types of some properties, see write_parquet()
+    :param on_progress: Function called with the progress events of the transform, 
+                        see report_transform_progress()
+    :param precision: Size of the grid the coordinates are snapped to, see quantize_geometry()
+    :param simplify_tolerance: If set, simplifies the geometries, see transform()
+    :param preserve_topology: If True, the simplification keeps the geometries valid
+    :param total: Number of features of the input file, used for the progress if stop
+                  is not set. By default, it is counted before the transform
+    :return: Dictionary with the schema, crs, epsg and feature_count of the range
+    """
+    batches = read_batches(file_name, engine, batch_size, start, stop, 
+                           hex=output_format != "parquet", spatial_key=spatial_key,
+                           bbox_columns=bbox_columns, precision=precision, 
+                           simplify_tolerance=simplify_tolerance, 
+                           preserve_topology=preserve_topology)
+    if on_progress:
+        progress_start = time.perf_counter()
+        if stop is not None:
+            total = stop - (start or 0)
+        elif total is None:
+            total = get_feature_count(file_name)
+        batches = report_transform_progress(batches, on_progress, file_name, progress_start, 
+                                            output_file, total)
+    if state_file:
+        batches = detect_changes(batches, state_file, id_field, get_deleted_file_name(file_name))
+    if oversized:
+        batches = limit_geometry_size(batches, oversized, get_oversized_file_name(output_file))
+    if sort_memory:
+        batches = sort_batches(batches, sort_memory, batch_size)
+    if output_format == "parquet":
+        metadata = write_parquet(batches, output_file, compression, field_types)
+    else:
+        with open_output(output_file, compression) as file:
+            metadata = write_csv(batches, file, header)
+    if on_progress:
+        # The bytes of the closed file, including the buffered and compressed data
+        on_progress(get_progress_event('transform', file_name, progress_start, True, total, 
+                                       features=total, bytes=os.path.getsize(output_file)))
+    return metadata
+
+def transform_parallel(file_name, output_file, engine="fiona", batch_size=65536,
+                       workers=1, keep_parts=False, parts=None, compression=None,
+                       output_format="csv", checkpoint=None, on_checkpoint=None,
+                       spatial_key=None, bbox_columns=False, oversized=None, field_types=None,
+                       on_progress=None, precision=None, simplify_tolerance=None,
+                       preserve_topology=False, feature_count=None):
+    """Creates a CSV file with EWKB geometries using a pool of processes.
+    Each range of features is transformed to its own CSV part.
+    The parts are concatenated in order unless keep_parts is True.
+
+    :param file_name: Input file in one of the supported geospatial formats
+    :param output_file: Path of the CSV file to write
+    :param engine: Transform engine, "fiona" or "arrow"
+    :param batch_size: Number of features per batch
+    :param workers: Number of processes
+    :param keep_parts: If True, the parts are kept as separate files with their own header
+    :param parts: Number of feature ranges. By default, one per process
+    :param compression: Compress the CSV files while they are written: "gzip", "zstd" or "bzip2".
+                        The compressed parts are concatenated as multiple members/frames
+    :param output_format: "csv" or "parquet"
+    :param checkpoint: Dictionary where the metadata of each part is recorded under 
+                       parts. The recorded parts that still exist are not transformed again
+    :param on_checkpoint: Function called without arguments after checkpoint is updated
+    :param spatial_key: True or extent to add a spatial_key property, see transform()
+    :param bbox_columns: If True, adds the bounding box properties, see transform()
+    :param oversized: Policy for the oversized geometries, see limit_geometry_size().
+                      The oversized features of all the parts are written to a single file
+    :param field_types: Redshift data types of some properties, see write_parquet()
+    :param on_progress: Function called with the progress events of the transform. 
+                        The processes do not report their progress, an event is 
+                        emitted each time a part is completed
+    :param precision: Size of the grid the coordinates are snapped to, see quantize_geometry()
+    :param simplify_tolerance: If set, simplifies the geometries, see transform()
+    :param preserve_topology: If True, the simplification keeps the geometries valid
+    :param feature_count: Number of features of the input file. By default, it is counted
+    :return: Dictionary with the metadata of the transformed file, see transform()
+    """
+
+    if feature_count is None:
+        feature_count = get_feature_count(file_name)
+
+    ranges = get_feature_ranges(feature_count, parts or workers)
+    part_files = [
+        get_part_file_name(file_name, part, compression, output_format)
+        for part in range(len(ranges))
+    ]
+    completed = checkpoint.setdefault('parts', {}) if checkpoint is not None else {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+        futures = {
+            executor.submit(
+                transform_range,
+                file_name,
+                part_file,
+                engine,
+                batch_size,
+                start,
+                stop,
+                # Only the first part has the header row if the parts are concatenated
+                keep_parts or part == 0,
+                compression,
+                output_format,
+                spatial_key=spatial_key,
+                bbox_columns=bbox_columns,
+                oversized=oversized,
+                field_types=field_types,
+                precision=precision,
+                simplify_tolerance=simplify_tolerance,
+                preserve_topology=preserve_topology
+            ): part_file
+            for part, (part_file, (start, stop)) in enumerate(zip(part_files, ranges))
+            if not (part_file in completed and os.path.exists(part_file))
+        }
+        # Only the parts transformed by this call count for the rate and the ETA
+        progress_start = time.perf_counter()
+        progress_total = sum(
+            stop - start for part_file, (start, stop) in zip(part_files, ranges) 
+            if part_file in futures.values()
+        )
+        progress = {'features': 0, 'bytes': 0}
+        for future in concurrent.futures.as_completed(futures):
+            completed[futures[future]] = future.result()
+            if on_checkpoint:
+                on_checkpoint()
+            if on_progress:
+                progress['features'] += completed[futures[future]]['feature_count']
+                progress['bytes'] += os.path.getsize(futures[future])
+                on_progress(get_progress_event(
+                    'transform', 
+                    file_name, 
+                    progress_start, 
+                    progress['features'] >= progress_total, 
+                    progress_total, 
+                    **progress
+                ))
+    metadata = merge_metadata([completed[part_file] for part_file in part_files])
+
+    if metadata.get('oversized_file'):
+        oversized_file = get_oversized_file_name(output_file)
+        with open(oversized_file, "wb") as file:
+            for part_file in part_files:
+                part_oversized_file = completed[part_file].get('oversized_file')
+                if part_oversized_file:
+                    with open(part_oversized_file, "rb") as part:
+                        shutil.copyfileobj(part, file)
+                    os.remove(part_oversized_file)
+        metadata['oversized_file'] = oversized_file
+
+    if keep_parts:
+        metadata['files'] = part_files
+        metadata['parts'] = True
+        return metadata
+
+    # Concatenate the parts in order
+    with open(output_file, "wb") as file:
+        for part_file in part_files:
+            with open(part_file, "rb") as part:
+                shutil.copyfileobj(part, file)
+            os.remove(part_file)
+
+    metadata['files'] = [output_file]
+    metadata['parts'] = False
+    return metadata
+
+def merge_metadata(range_metadata):
+    """Merges the metadata of several ranges of features of the same input file
+
+    :param range_metadata: List of metadata dictionaries in feature order
+    :return: Metadata dictionary
+    """
+    metadata = dict(range_metadata[0])
+    metadata['feature_count'] = sum(part['feature_count'] for part in range_metadata)
+    if 'oversized' in metadata:
+        metadata['oversized'] = {
+            action: sum(part['oversized'][action] for part in range_metadata)
+            for action in metadata['oversized']
+        }
+        metadata['oversized_file'] = next(
+            (part['oversized_file'] for part in range_metadata if part['oversized_file']), 
+            None
+        )
+    for counts in ('quantized', 'simplification'):
+        if counts in metadata:
+            metadata[counts] = {
+                key: sum(part[counts][key] for part in range_metadata)
+                for key in metadata[counts]
+            }
+    return metadata
+
+def get_feature_ranges(feature_count, parts):
+    """Splits the features in contiguous index ranges of similar size
+
+    :param feature_count: Number of features
+    :param parts: Number of ranges
+    :return: List of (start, stop) tuples
+    """
+    parts = max(1, min(parts, feature_count))
+    size, remainder = divmod(feature_count, parts)
+    ranges = []
+    start = 0
+    for part in range(parts):
+        stop = start + size + (1 if part < remainder else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+def get_feature_count(file_name):
+    """Gets the number of features of the input file without reading them
+
+    :param file_name: Input file in one of the supported geospatial formats
+    :return: Number of features
+    """
+    with fiona.open(file_name, "r") as source:
+        return len(source)
+
+def get_progress_event(stage, file_name, start, done=False, total=None, **counters):
+    """Builds a progress event of an import stage. The events are plain dictionaries, 
+    so they can be rendered as a progress bar (see print_progress()), written as 
+    JSON lines or sent to a metrics system.
+
+    :param stage: "transform", "upload" or "copy"
+    :param file_name: Input file (transform), uploaded file (upload) or S3 path (copy)
+    :param start: perf_counter() value when the stage started
+    :param done: True for the last event of the stage
+    :param total: Expected value of the first counter, used for the percent and the ETA
+    :param counters: Work done so far, i.e. features=1000, bytes=65536. A rate per second 
+                     is added for each one, i.e. features_per_second
+    :return: Dictionary with the stage, file, done, elapsed seconds, counters, rates, 
+             and with total, also total, percent and eta (remaining seconds)
+    """
+    elapsed = time.perf_counter() - start
+    event = OrderedDict([('stage', stage), ('file', file_name), ('done', done), ('elapsed', elapsed)])
+    for name, value in counters.items():
+        event[name] = value
+        if value is not None:
+            event[name + '_per_second'] = value / elapsed if elapsed > 0 else 0.0
+    if total is not None:
+        done_count = next(iter(counters.values()), None) or 0
+        event['total'] = total
+        event['percent'] = 100.0 * done_count / total if total else 100.0
+        event['eta'] = (total - done_count) * elapsed / done_count if done_count else None
+    return event
+
+def report_transform_progress(batches, on_progress, file_name, start, output_file=None, 
+                              total=None, interval=1.0):
+    """Reports the progress of the transform while the batches are read, without changing them
+
+    :param batches: Generator returned by read_batches()
+    :param on_progress: Function called with each progress event, see get_progress_event()
+    :param file_name: Input file
+    :param start: perf_counter() value when the transform started
+    :param output_file: File being written. If set, its size is reported as bytes
+    :param total: Number of features to read, used for the ETA
+    :param interval: Minimum seconds between events
+    :return: Generator with the same items as batches
+    """
+    yield next(batches)
+    features = 0
+    reported = start
+    for geometries, columns in batches:
+        features += len(geometries)
+        now = time.perf_counter()
+        if now - reported >= interval:
+            reported = now
+            written = None
+            if output_file and os.path.exists(output_file):
+                written = os.path.getsize(output_file)
+            on_progress(get_progress_event('transform', file_name, start, False, total, 
+                                           features=features, bytes=written))
+        yield geometries, columns
+
+def get_output_file_name(file_name, compression=None, output_format="csv"):
+    """Gets the path of the CSV or Parquet file
+
+    :param file_name: Input file
+    :param compression: Compression of the CSV file
+    :param output_format: "csv" or "parquet"
+    :return: Path of the file
+    """
+    if output_format == "parquet":
+        return file_name + ".processing.parquet"
+    return file_name + ".processing.csv" + COMPRESSION_EXTENSIONS.get(compression, "")
+
+def get_part_file_name(file_name, part, compression=None, output_format="csv"):
+    """Gets the path of a CSV or Parquet part
+
+    :param file_name: Input file
+    :param part: Part number
+    :param compression: Compression of the CSV part
+    :param output_format: "csv" or "parquet"
+    :return: Path of the part
+    """
+    if output_format == "parquet":
+        return "{0}.processing.part{1:05d}.parquet".format(file_name, part)
+    return "{0}.processing.part{1:05d}.csv{2}".format(
+        file_name, 
+        part, 
+        COMPRESSION_EXTENSIONS.get(compression, "")
+    )
+
+def get_deleted_file_name(file_name):
+    """Gets the path of the CSV file with the ids of the features deleted since the previous import
+
+    :param file_name: Input file
+    :return: Path of the file
+    """
+    return file_name + ".processing.deleted.csv"
+
+def get_oversized_file_name(output_file):
+    """Gets the path of the GeoJSON sequence file with the oversized features of 
+    a CSV or Parquet file or part
+
+    :param output_file: Path of the CSV or Parquet file
+    :return: Path of the file
+    """
+    return re.sub(r"\.(csv|parquet)(\.\w+)?$", ".oversized.geojsonl", output_file)
+
+def open_output(output_file, compression=None):
+    """Opens a text file for writing, compressing it on the fly if requested.
+    zstd compression uses all the available cores.
+
+    :param output_file: Path of the file
+    :param compression: None, "gzip", "zstd" or "bzip2"
+    :return: Text file object
+    """
+    if compression == "gzip":
+        return gzip.open(output_file, "wt", compresslevel=6)
+    if compression == "bzip2":
+        return bz2.open(output_file, "wt")
+    if compression == "zstd":
+        # Optional dependency only needed for zstd compression
+        import zstandard
+        return zstandard.open(output_file, "wt", cctx=zstandard.ZstdCompressor(threads=-1))
+    return open(output_file, "w")
+
+def compress_writer(file, compression=None):
+    """Wraps a binary file object to compress the data written to it. 
+    Closing the returned object does not close the wrapped file object.
+
+    :param file: Binary file object
+    :param compression: None, "gzip", "zstd" or "bzip2"
+    :return: Binary file object
+    """
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=file, mode="wb", compresslevel=6)
+    if compression == "bzip2":
+        return bz2.BZ2File(file, "wb")
+    if compression == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(threads=-1).stream_writer(file, closefd=False)
+    return file
+
+def write_manifest(file_name, part_files, bucket):
+    """Writes a COPY manifest listing the CSV or Parquet parts uploaded to S3.
+    The content length of each part is included because COPY requires it for Parquet.
+
+    :param file_name: Input file
+    :param part_files: Paths of the parts, also used as S3 keys
+    :param bucket: Bucket where the parts are uploaded
+    :return: Path of the manifest file
+    """
+    manifest_file = file_name + ".processing.manifest"
+    manifest = {
+        'entries': [
+            {
+                'url': "s3://{0}/{1}".format(bucket, part_file), 
+                'mandatory': True,
+                'meta': {'content_length': os.path.getsize(part_file)}
+            }
+            for part_file in part_files
+        ]
+    }
+    with open(manifest_file, "w") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest_file
+
+def read_batches(file_name, engine="fiona", batch_size=65536, start=None, stop=None, hex=True,
+                 spatial_key=None, bbox_columns=False, precision=None, simplify_tolerance=None,
+                 preserve_topology=False):
+    """Reads batches of features with the geometries encoded as EWKB
 
     :param file_name: Input file in one of the supported geospatial formats
-    :return: Returns the path to the transformed file
+    :param engine: Transform engine, "fiona" or "arrow"
+    :param batch_size: Number of features per batch
+    :param start: Index of the first feature to read
+    :param stop: Index after the last feature to read
+    :param hex: If True, the geometries are encoded as hex strings, else as bytes
+    :param spatial_key: True or (minx, miny, maxx, maxy) extent to add a spatial_key 
+                        property with the Hilbert index of each geometry. True uses the 
+                        extent of the input file
+    :param bbox_columns: If True, adds minx, miny, maxx and maxy properties with the 
+                         bounding box of each geometry (None for empty geometries)
+    :param precision: If set, the coordinates are snapped to a grid of this size before 
+                      encoding them, see quantize_geometry()
+    :param simplify_tolerance: If set, the geometries are simplified with this tolerance 
+                               before snapping and encoding them
+    :param preserve_topology: If True, the simplification keeps the geometries valid
+    :return: Generator that first yields the metadata dictionary of the range
+             (its feature_count is updated as the batches are read) and then
+             (geometries, property columns) tuples. With precision, the metadata also has 
+             the quantized counts: vertices_removed and bytes_saved in the encoded geometries.
+             With simplify_tolerance, the simplification counts: vertices_before and 
+             vertices_removed
     """
+    if engine == "arrow":
+        return read_batches_arrow(file_name, batch_size, start, stop, hex, spatial_key, 
+                                  bbox_columns, precision, simplify_tolerance, preserve_topology)
+    return read_batches_fiona(file_name, batch_size, start, stop, hex, spatial_key, bbox_columns,
+                              precision, simplify_tolerance, preserve_topology)
 
-    output_file = file_name + ".processing.csv"
-     
+def read_batches_fiona(file_name, batch_size=65536, start=None, stop=None, hex=True,
+                       spatial_key=None, bbox_columns=False, precision=None, 
+                       simplify_tolerance=None, preserve_topology=False):
+    """Reads batches of features processing them one by one with Fiona and Shapely.
+    See read_batches().
+    """
     with fiona.open(file_name, "r") as source:
         # Get the EPSG code (srid)
         epsg = -1
         if 'init' in source.crs.keys():
-            epsg = int(source.crs['init'].split(':')[1])          
-            geos.WKBWriter.defaults['include_srid'] = True
-        # Write the CSV file row by row
-        with open(output_file, "w") as file:
-            writer = csv.writer(file, delimiter=",", lineterminator="\n")
-            firstRow = True
-            for f in source:
-                try:
-                    if firstRow:
-                        writer.writerow(
-                            ['geom'] + 
-                            list(f["properties"].keys())
-                        )
-                        firstRow = False
+            epsg = int(source.crs['init'].split(':')[1])
+            # WKBWriter is not available anymore in Shapely 2
+            if hasattr(geos, 'WKBWriter'):
+                geos.WKBWriter.defaults['include_srid'] = True
+        metadata = {
+            'schema': source.schema,
+            'crs': dict(source.crs),
+            'epsg': epsg,
+            'feature_count': 0
+        }
+        if precision:
+            metadata['quantized'] = {'vertices_removed': 0, 'bytes_saved': 0}
+        if simplify_tolerance:
+            metadata['simplification'] = {'vertices_before': 0, 'vertices_removed': 0}
+        fields = list(source.schema['properties'].keys())
+        extent = source.bounds if spatial_key is True else spatial_key
+        if extent or bbox_columns:
+            metadata['schema'] = add_geometry_properties(metadata['schema'], bbox_columns, extent)
+        yield metadata
+
+        if start is None and stop is None:
+            features = iter(source)
+        else:
+            features = source.filter(start or 0, stop)
+        geometries = []
+        rows = []
+        bounds = []
+        for f in features:
+            try:
+                geometry = shape(f["geometry"])
+                if simplify_tolerance:
+                    vertices = get_vertex_count(geometry)
+                    geometry = geometry.simplify(simplify_tolerance, preserve_topology=preserve_topology)
+                    metadata['simplification']['vertices_before'] += vertices
+                    metadata['simplification']['vertices_removed'] += (
+                        vertices - get_vertex_count(geometry)
+                    )
+                if precision:
+                    quantized, removed = quantize_geometry(mapping(geometry), precision)
+                    geometry = shape(quantized)
+                    if removed:
+                        update_quantized_counts(metadata['quantized'], removed, 
+                                                geometry.has_z, hex)
+                if epsg != -1:
+                    geometries.append(wkb.dumps(geometry, hex=hex, srid=epsg))
+                else:
+                    geometries.append(wkb.dumps(geometry, hex=hex))
+                rows.append([f["properties"][field] for field in fields])
+                if extent or bbox_columns:
+                    # Shapely 1.8 returns empty bounds for empty geometries
+                    bounds.append(geometry.bounds or (float('nan'),) * 4)
+            except Exception:
+                logging.exception("Error processing feature %s:", f["id"])
+                break
+            if len(rows) == batch_size:
+                metadata['feature_count'] += len(rows)
+                yield geometries, get_fiona_columns(rows, bounds, bbox_columns, extent)
+                geometries = []
+                rows = []
+                bounds = []
+        if rows:
+            metadata['feature_count'] += len(rows)
+            yield geometries, get_fiona_columns(rows, bounds, bbox_columns, extent)
+
+def get_fiona_columns(rows, bounds, bbox_columns=False, extent=None):
+    """Gets the property columns of a batch of features read with Fiona
+
+    :param rows: List with the property values of each feature
+    :param bounds: List with the bounds of each feature, used to compute the 
+                   bounding box and spatial key properties
+    :param bbox_columns: If True, adds the bounding box properties
+    :param extent: Extent of the spatial key, None if there is no spatial key
+    :return: List of property columns
+    """
+    columns = [list(column) for column in zip(*rows)]
+    if bbox_columns or extent:
+        columns += get_geometry_columns(list(zip(*bounds)), bbox_columns, extent)
+    return columns
+
+def get_geometry_columns(bounds, bbox_columns=False, extent=None):
+    """Gets the property columns computed from the bounds of the geometries
+
+    :param bounds: Sequences with the minx, miny, maxx and maxy of each geometry, 
+                   NaN for empty geometries
+    :param bbox_columns: If True, gets the minx, miny, maxx and maxy columns
+    :param extent: Extent of the spatial key, None if there is no spatial key
+    :return: List of property columns, in the order of add_geometry_properties()
+    """
+    columns = []
+    if bbox_columns:
+        columns += [
+            [None if math.isnan(value) else float(value) for value in values] 
+            for values in bounds
+        ]
+    if extent:
+        import numpy as np
+
+        minx, miny, maxx, maxy = [np.asarray(values, dtype=np.float64) for values in bounds]
+        columns.append(get_spatial_keys((minx + maxx) / 2, (miny + maxy) / 2, extent))
+    return columns
+
+def add_geometry_properties(schema, bbox_columns=False, spatial_key=False):
+    """Adds the properties computed from the geometries to a Fiona schema
+
+    :param schema: Fiona schema
+    :param bbox_columns: If True, adds the minx, miny, maxx and maxy properties
+    :param spatial_key: If True, adds the spatial_key property
+    :return: New schema
+    """
+    properties = OrderedDict(schema['properties'])
+    if bbox_columns:
+        for column in BBOX_COLUMNS:
+            properties[column] = 'float'
+    if spatial_key:
+        properties['spatial_key'] = 'int'
+    return dict(schema, properties=properties)
+
+def get_spatial_keys(x, y, extent, order=16):
+    """Gets the position along a Hilbert curve of a list of points. The extent is divided 
+    in a grid of 2^order x 2^order cells and the cells are numbered following the curve, 
+    so features close in the table are also close in space and the zone maps of a 
+    SORTKEY on the keys prune the blocks outside a bounding box. Requires NumPy.
+
+    :param x: X coordinates
+    :param y: Y coordinates
+    :param extent: (minx, miny, maxx, maxy) tuple. Points outside it get the key of
+                   the closest cell
+    :param order: Number of bits of each coordinate in the grid
+    :return: List of keys, None for points with NaN coordinates (empty geometries)
+    """
+    import numpy as np
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = np.isfinite(x) & np.isfinite(y)
+    side = 1 << order
+    minx, miny, maxx, maxy = extent
+    # Cell of each point
+    cx = np.clip(np.nan_to_num((x - minx) / ((maxx - minx) or 1) * side), 0, side - 1).astype(np.int64)
+    cy = np.clip(np.nan_to_num((y - miny) / ((maxy - miny) or 1) * side), 0, side - 1).astype(np.int64)
+    keys = np.zeros(len(x), dtype=np.int64)
+    s = side >> 1
+    while s > 0:
+        rx = ((cx & s) > 0).astype(np.int64)
+        ry = ((cy & s) > 0).astype(np.int64)
+        keys += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant
+        flip = (ry == 0) & (rx == 1)
+        cx = np.where(flip, side - 1 - cx, cx)
+        cy = np.where(flip, side - 1 - cy, cy)
+        cx, cy = np.where(ry == 0, cy, cx), np.where(ry == 0, cx, cy)
+        s >>= 1
+    return [int(key) if is_valid else None for key, is_valid in zip(keys, valid)]
+
+def get_spatial_key_ranges(bbox, extent, level=8, order=16):
+    """Gets the ranges of spatial keys that cover a bounding box. The extent is divided in 
+    a coarser grid of 2^level x 2^level cells: the keys of the cells of the spatial key 
+    grid inside each coarse cell are consecutive, so each coarse cell that intersects 
+    the bounding box is a range of keys.
+
+    :param bbox: (minx, miny, maxx, maxy) tuple
+    :param extent: Extent of the spatial key, see get_spatial_keys()
+    :param level: Number of bits of each coordinate in the coarse grid. Higher levels 
+                  give tighter but more ranges
+    :param order: Number of bits of each coordinate in the spatial key grid
+    :return: List of (first, last) tuples with the sorted ranges of keys
+    """
+    minx, miny, maxx, maxy = extent
+    cells = 1 << level
+
+    def get_cell(value, minimum, maximum):
+        return min(max(int((value - minimum) / ((maximum - minimum) or 1) * cells), 0), cells - 1)
+
+    columns = range(get_cell(bbox[0], minx, maxx), get_cell(bbox[2], minx, maxx) + 1)
+    rows = range(get_cell(bbox[1], miny, maxy), get_cell(bbox[3], miny, maxy) + 1)
+    # Key of each coarse cell computed from its center
+    coarse_keys = sorted(get_spatial_keys(
+        [minx + (column + 0.5) * (maxx - minx) / cells for column in columns for row in rows],
+        [miny + (row + 0.5) * (maxy - miny) / cells for column in columns for row in rows],
+        extent,
+        level
+    ))
+    size = 4 ** (order - level)
+    ranges = []
+    for key in coarse_keys:
+        if ranges and ranges[-1][1] + 1 == key * size:
+            ranges[-1] = (ranges[-1][0], (key + 1) * size - 1)
+        else:
+            ranges.append((key * size, (key + 1) * size - 1))
+    return ranges
+
+def get_spatial_key_condition(bbox, extent, level=8):
+    """Gets a SQL condition on the spatial_key column that selects the features whose 
+    bounding box center is in the cells covering a bounding box. Combined with an exact 
+    spatial predicate, it lets the zone maps skip the blocks of a table sorted by spatial key.
+    Expand the bounding box by half the size of the largest feature to also select the
+    features that intersect it with their center outside it.
+
+    :param bbox: (minx, miny, maxx, maxy) tuple
+    :param extent: Extent of the spatial key used in the import
+    :param level: Level of the coarse grid, see get_spatial_key_ranges()
+    :return: SQL condition
+    """
+    return "({0})".format(" OR ".join(
+        "spatial_key BETWEEN {0} AND {1}".format(first, last)
+        for first, last in get_spatial_key_ranges(bbox, extent, level)
+    ))
+
+def read_batches_arrow(file_name, batch_size=65536, start=None, stop=None, hex=True,
+                       spatial_key=None, bbox_columns=False, precision=None, 
+                       simplify_tolerance=None, preserve_topology=False):
+    """Reads the features in Arrow record batches with pyogrio. The geometries in each
+    batch are encoded with vectorized Shapely 2 functions instead of feature by feature.
+    Requires pyogrio, pyarrow and Shapely 2. See read_batches().
+    """
+
+    # Optional dependencies only needed by the arrow engine
+    import shapely
+    from pyogrio import read_info
+    from pyogrio.raw import open_arrow
+
+    skip_features = start or 0
+    # max_features is not supported when reading Arrow streams
+    remaining = None if stop is None else stop - skip_features
+    with open_arrow(file_name, batch_size=batch_size, skip_features=skip_features,
+                    use_pyarrow=True) as (meta, reader):
+        # Get the EPSG code (srid)
+        epsg = get_epsg_code(meta['crs'])
+        geometry_name = meta['geometry_name']
+        if not geometry_name:
+            # Default name of the geometry column depending on the GDAL version
+            geometry_name = 'wkb_geometry' if 'wkb_geometry' in reader.schema.names else 'wkb'
+        fields = [field for field in reader.schema if field.name != geometry_name]
+        metadata = {
+            'schema': {
+                'geometry': meta['geometry_type'],
+                'properties': OrderedDict(
+                    (field.name, get_fiona_type(field)) for field in fields
+                )
+            },
+            'crs': meta['crs'],
+            'epsg': epsg,
+            'feature_count': 0
+        }
+        if precision:
+            metadata['quantized'] = {'vertices_removed': 0, 'bytes_saved': 0}
+        if simplify_tolerance:
+            metadata['simplification'] = {'vertices_before': 0, 'vertices_removed': 0}
+        extent = spatial_key
+        if spatial_key is True:
+            extent = tuple(read_info(file_name, force_total_bounds=True)['total_bounds'])
+        if extent or bbox_columns:
+            metadata['schema'] = add_geometry_properties(metadata['schema'], bbox_columns, extent)
+        yield metadata
+
+        for batch_number, batch in enumerate(reader):
+            if remaining is not None:
+                if remaining <= 0:
+                    break
+                batch = batch.slice(0, remaining)
+                remaining -= batch.num_rows
+            if batch.num_rows == 0:
+                continue
+            columns = [batch.column(field.name) for field in fields]
+            try:
+                geometries = shapely.from_wkb(
+                    batch.column(geometry_name).to_numpy(zero_copy_only=False)
+                )
+                if simplify_tolerance:
+                    vertices = shapely.get_num_coordinates(geometries).sum()
+                    geometries = shapely.simplify(geometries, simplify_tolerance, 
+                                                  preserve_topology=preserve_topology)
+                    metadata['simplification']['vertices_before'] += int(vertices)
+                    metadata['simplification']['vertices_removed'] += int(
+                        vertices - shapely.get_num_coordinates(geometries).sum()
+                    )
+                if precision:
+                    geometries = quantize_geometries(geometries, precision, 
+                                                     metadata['quantized'], hex)
+                if extent or bbox_columns:
+                    columns += get_geometry_columns(
+                        shapely.bounds(geometries).T, 
+                        bbox_columns, 
+                        extent
+                    )
+                if epsg != -1:
+                    geometries = shapely.set_srid(geometries, epsg)
+                geometries = shapely.to_wkb(geometries, hex=hex, include_srid=epsg != -1)
+            except Exception:
+                logging.exception("Error processing batch %s:", batch_number)
+                break
+            metadata['feature_count'] += batch.num_rows
+            yield geometries, columns
+
+def quantize_geometry(geometry, precision):
+    """Snaps the coordinates of a geometry to a grid and removes the consecutive duplicate 
+    vertices created by the snapping. Only x and y are snapped. The vertices of a line 
+    or a ring are only removed if it keeps enough of them to be valid (2 and 4), 
+    so no part of the geometry disappears.
+
+    :param geometry: GeoJSON-like geometry mapping, i.e. a Fiona feature geometry
+    :param precision: Size of the grid in units of the CRS
+    :return: Tuple with the snapped geometry mapping and the number of vertices removed
+    """
+    geometry_type = geometry['type']
+    if geometry_type == 'GeometryCollection':
+        parts = [quantize_geometry(part, precision) for part in geometry['geometries']]
+        return (
+            {'type': geometry_type, 'geometries': [part for part, _ in parts]},
+            sum(removed for _, removed in parts)
+        )
+
+    coordinates = geometry['coordinates']
+    removed = 0
+    if geometry_type == 'Point':
+        coordinates = snap_coordinates(coordinates, precision) if coordinates else coordinates
+    elif geometry_type == 'MultiPoint':
+        coordinates = [snap_coordinates(point, precision) for point in coordinates]
+    elif geometry_type == 'LineString':
+        coordinates, removed = quantize_coordinates(coordinates, precision, 2)
+    elif geometry_type in ('MultiLineString', 'Polygon'):
+        min_vertices = 2 if geometry_type == 'MultiLineString' else 4
+        parts = [quantize_coordinates(part, precision, min_vertices) for part in coordinates]
+        coordinates = [part for part, _ in parts]
+        removed = sum(count for _, count in parts)
+    elif geometry_type == 'MultiPolygon':
+        parts = [
+            [quantize_coordinates(ring, precision, 4) for ring in polygon] 
+            for polygon in coordinates
+        ]
+        coordinates = [[ring for ring, _ in polygon] for polygon in parts]
+        removed = sum(count for polygon in parts for _, count in polygon)
+    else:
+        raise ValueError("Unsupported geometry type: {0}".format(geometry_type))
+    return {'type': geometry_type, 'coordinates': coordinates}, removed
+
+def snap_coordinates(coordinate, precision):
+    """Snaps the x and y of a coordinate to a grid
+
+    :param coordinate: (x, y) or (x, y, z) tuple
+    :param precision: Size of the grid in units of the CRS
+    :return: Snapped coordinate tuple
+    """
+    return (
+        round(coordinate[0] / precision) * precision, 
+        round(coordinate[1] / precision) * precision
+    ) + tuple(coordinate[2:])
+
+def quantize_coordinates(coordinates, precision, min_vertices=2):
+    """Snaps the vertices of a line or a ring to a grid and removes the consecutive 
+    duplicates, see quantize_geometry()
+
+    :param coordinates: Sequence of coordinate tuples
+    :param precision: Size of the grid in units of the CRS
+    :param min_vertices: The duplicates are kept if fewer vertices would remain
+    :return: Tuple with the list of snapped coordinates and the number of vertices removed
+    """
+    snapped = [snap_coordinates(coordinate, precision) for coordinate in coordinates]
+    # The last vertex of each run of duplicates is kept, so the rings stay closed
+    deduplicated = [
+        coordinate for coordinate, next_coordinate in zip(snapped, snapped[1:]) 
+        if coordinate != next_coordinate
+    ] + snapped[-1:]
+    if len(deduplicated) < min_vertices:
+        return snapped, 0
+    return deduplicated, len(snapped) - len(deduplicated)
+
+def quantize_geometries(geometries, precision, counts, hex=True):
+    """Vectorized quantize_geometry() for an array of Shapely 2 geometries. The coordinates 
+    of all the geometries are snapped at once. Only the geometries with consecutive duplicate 
+    vertices after the snapping are rebuilt with quantize_geometry(), so both engines 
+    write the same EWKB.
+
+    :param geometries: Array of Shapely 2 geometries, modified in place
+    :param precision: Size of the grid in units of the CRS
+    :param counts: Quantized counts updated with the vertices removed, 
+                   see update_quantized_counts()
+    :param hex: If True, the geometries will be encoded as hex strings
+    :return: Array of quantized geometries
+    """
+    import numpy as np
+    import shapely
+
+    has_z = shapely.has_z(geometries)
+    for include_z in (False, True):
+        indices = np.flatnonzero(has_z == include_z)
+        if len(indices) == 0:
+            continue
+        subset = geometries[indices]
+        coordinates = shapely.get_coordinates(subset, include_z=include_z)
+        # Adding 0.0 turns the -0.0 of the values rounded to 0 into 0.0, like round() does
+        coordinates[:, :2] = np.round(coordinates[:, :2] / precision) * precision + 0.0
+        subset = shapely.set_coordinates(subset, coordinates)
+        # Also the last vertex of a part and the first of the next one, checked again below
+        owners = np.repeat(np.arange(len(subset)), shapely.get_num_coordinates(subset))
+        duplicated = np.all(coordinates[1:] == coordinates[:-1], axis=1) & (owners[1:] == owners[:-1])
+        for owner in np.unique(owners[1:][duplicated]):
+            quantized, removed = quantize_geometry(mapping(subset[owner]), precision)
+            if removed:
+                subset[owner] = shape(quantized)
+                update_quantized_counts(counts, removed, include_z, hex)
+        geometries[indices] = subset
+    return geometries
+
+def update_quantized_counts(counts, removed, has_z=False, hex=True):
+    """Adds the vertices removed from a geometry by quantize_geometry() to the quantized 
+    counts of the metadata
+
+    :param counts: Dictionary with the vertices_removed and the bytes_saved
+    :param removed: Number of vertices removed
+    :param has_z: True if the vertices have z coordinate
+    :param hex: If True, the geometries are encoded as hex strings, with 2 characters per byte
+    """
+    counts['vertices_removed'] += removed
+    counts['bytes_saved'] += removed * 8 * (3 if has_z else 2) * (2 if hex else 1)
+
+def get_vertex_count(geometry):
+    """Gets the number of vertices of a geometry, like shapely.get_num_coordinates() 
+    but also with Shapely 1.8
+
+    :param geometry: Shapely geometry
+    :return: Number of vertices
+    """
+    if hasattr(geometry, 'geoms'):
+        return sum(get_vertex_count(part) for part in geometry.geoms)
+    if geometry.is_empty:
+        return 0
+    if geometry.geom_type == 'Polygon':
+        return len(geometry.exterior.coords) + sum(len(ring.coords) for ring in geometry.interiors)
+    return len(geometry.coords)
+
+def get_epsg_code(crs):
+    """Gets the EPSG code from a CRS string as returned by pyogrio (i.e. "EPSG:4326")
+
+    :param crs: CRS string
+    :return: EPSG code or -1 if the CRS is not identified by an EPSG code
+    """
+    if crs and crs.upper().startswith('EPSG:'):
+        return int(crs.split(':')[1])
+    return -1
+
+def get_fiona_type(arrow_field):
+    """Maps an Arrow field to a Fiona field type, so get_field_mappings() can be
+    used with the schema read by the arrow engine. The width of the string fields 
+    is read from the GDAL field metadata, if it is not available they are mapped 
+    to "str" like Fiona does, so both engines create the same table.
+
+    :param arrow_field: Arrow field
+    :return: Fiona field type
+    """
+    import pyarrow as pa
+
+    arrow_type = arrow_field.type
+
+    if pa.types.is_boolean(arrow_type):
+        return 'bool'
+    if pa.types.is_integer(arrow_type):
+        return 'int'
+    if pa.types.is_floating(arrow_type):
+        return 'float'
+    if pa.types.is_date(arrow_type):
+        return 'date'
+    if pa.types.is_time(arrow_type):
+        return 'time'
+    if pa.types.is_timestamp(arrow_type):
+        return 'datetime'
+    width = (arrow_field.metadata or {}).get(b'GDAL:OGR:width')
+    if width and int(width) > 0:
+        return 'str:{0}'.format(int(width))
+    return 'str'
+
+def detect_changes(batches, state_file, id_field, deleted_file):
+    """Filters the batches keeping only the features inserted or updated since the previous
+    import of the same source. Each feature is identified by the value of id_field and 
+    compared with the hash of its EWKB geometry and properties stored in state_file.
+    The new hashes are written to <state_file>.new, see commit_feature_hashes(), and 
+    the ids of the features not found anymore to deleted_file.
+
+    :param batches: Generator returned by read_batches()
+    :param state_file: CSV file with the id and hash of each feature of the previous import.
+                       If it does not exist, all the features are inserted
+    :param id_field: Property identifying the features
+    :param deleted_file: Path of the CSV file where the ids of the deleted features are written
+    :return: Generator like read_batches(). The metadata dictionary also has the changes
+             (inserted, updated, unchanged and deleted counts) and the deleted_file
+    """
+    previous = load_feature_hashes(state_file)
+    metadata = next(batches)
+    fields = list(metadata['schema']['properties'].keys())
+    if id_field not in fields:
+        raise ValueError("The id field {0} is not a property of the input file".format(id_field))
+    id_index = fields.index(id_field)
+    changes = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+    metadata['changes'] = changes
+    metadata['deleted_file'] = deleted_file
+    yield metadata
+
+    with open(state_file + ".new", "w") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        for geometries, columns in batches:
+            values = [get_csv_values(column) for column in columns]
+            changed = []
+            for row, geometry in enumerate(geometries):
+                row_values = [column[row] for column in values]
+                feature_id = str(row_values[id_index])
+                feature_hash = get_feature_hash(geometry, row_values)
+                writer.writerow([feature_id, feature_hash])
+                previous_hash = previous.pop(feature_id, None)
+                if previous_hash is None:
+                    changes['inserted'] += 1
+                    changed.append(row)
+                elif previous_hash != feature_hash:
+                    changes['updated'] += 1
+                    changed.append(row)
+                else:
+                    changes['unchanged'] += 1
+            if changed:
+                yield take_rows(geometries, changed), [take_rows(column, changed) for column in columns]
+
+    # The features of the previous import that have not been read were deleted
+    changes['deleted'] = len(previous)
+    with open(deleted_file, "w") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow([id_field])
+        writer.writerows([feature_id] for feature_id in previous)
+
+def get_feature_hash(geometry, values):
+    """Gets the content hash of a feature
+
+    :param geometry: EWKB geometry as hex string or bytes
+    :param values: Property values as written to the CSV file
+    :return: Hex digest
+    """
+    if isinstance(geometry, bytes):
+        # Same hash with the CSV and Parquet formats
+        geometry = geometry.hex().upper()
+    content = "\x1f".join([geometry or ""] + ["" if value is None else str(value) for value in values])
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+def take_rows(values, rows):
+    """Selects rows of a geometry or property column
+
+    :param values: List, NumPy array or Arrow array
+    :param rows: List of row indexes
+    :return: Column with the selected rows
+    """
+    if isinstance(values, list):
+        return [values[row] for row in rows]
+    return values.take(rows)
+
+def load_feature_hashes(state_file):
+    """Loads the feature hashes written by the previous import
+
+    :param state_file: CSV file with id and hash columns
+    :return: Dictionary mapping feature ids to hashes, empty if the file does not exist
+    """
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file, newline="") as file:
+        return dict(csv.reader(file))
+
+def commit_feature_hashes(state_file):
+    """Replaces the feature hashes of the previous import with the ones written by 
+    detect_changes(). It must be called only after the changes have been loaded, 
+    so a failed import is detected again by the next run.
+
+    :param state_file: CSV file with the feature hashes
+    """
+    os.replace(state_file + ".new", state_file)
+
+def limit_geometry_size(batches, policy, oversized_file, max_size=MAX_GEOMETRY_SIZE):
+    """Handles the geometries larger than the maximum size of a Redshift GEOMETRY, 
+    that would make COPY fail after the upload. Only the oversized geometries are 
+    decoded again, the rest of the batch is not modified.
+
+    :param batches: Generator returned by read_batches()
+    :param policy: "split" clips the geometry with a grid in pieces under the limit, 
+                   written as features with the same properties, see split_geometry().
+                   "simplify" simplifies the geometry with the smallest tolerance that 
+                   fits, see simplify_geometry(). "file" writes the feature to 
+                   oversized_file instead
+    :param oversized_file: Path of the GeoJSON sequence file for the "file" policy
+    :param max_size: Maximum size in bytes of the EWKB geometries
+    :return: Generator like read_batches(). The metadata dictionary also has the oversized 
+             counts (split, simplified and skipped) and the oversized_file if any 
+             feature was written to it. The properties computed from the geometries 
+             (bounding box and spatial key) keep the values of the original geometry
+    """
+    if policy not in ("split", "simplify", "file"):
+        raise ValueError("Unsupported oversized geometries policy: {0}".format(policy))
+
+    metadata = next(batches)
+    fields = list(metadata['schema']['properties'].keys())
+    counts = {'split': 0, 'simplified': 0, 'skipped': 0}
+    metadata['oversized'] = counts
+    metadata['oversized_file'] = None
+    yield metadata
+
+    epsg = metadata['epsg']
+    side_file = None
+    try:
+        for geometries, columns in batches:
+            oversized = set(
+                row for row, geometry in enumerate(geometries) 
+                if geometry is not None and get_wkb_size(geometry) > max_size
+            )
+            if not oversized:
+                yield geometries, columns
+                continue
+            rows = []
+            limited_geometries = []
+            for row, geometry in enumerate(geometries):
+                if row not in oversized:
+                    rows.append(row)
+                    limited_geometries.append(geometry)
+                    continue
+                hex = isinstance(geometry, str)
+                geometry = wkb.loads(geometry, hex=hex)
+                if policy == "file":
+                    if side_file is None:
+                        side_file = open(oversized_file, "w")
+                        metadata['oversized_file'] = oversized_file
+                    values = [get_csv_values(take_rows(column, [row]))[0] for column in columns]
+                    feature = {
+                        'type': 'Feature', 
+                        'geometry': mapping(geometry), 
+                        'properties': dict(zip(fields, values))
+                    }
+                    side_file.write(json.dumps(feature, default=str) + "\n")
+                    counts['skipped'] += 1
+                    continue
+                if policy == "simplify":
+                    pieces = [simplify_geometry(geometry, max_size)]
+                    counts['simplified'] += 1
+                else:
+                    pieces = split_geometry(geometry, max_size)
+                    counts['split'] += 1
+                for piece in pieces:
+                    rows.append(row)
                     if epsg != -1:
-                        writer.writerow(
-                            [wkb.dumps(shape(f["geometry"]), hex=True, srid=epsg)] + 
-                            list(f["properties"].values())
-                        )
+                        limited_geometries.append(wkb.dumps(piece, hex=hex, srid=epsg))
                     else:
-                        writer.writerow(
-                            [wkb.dumps(shape(f["geometry"]), hex=True)] + 
-                            list(f["properties"].values())
-                        )
-                except Exception:
-                    logging.exception("Error processing feature %s:", f["id"])
-                    break
+                        limited_geometries.append(wkb.dumps(piece, hex=hex))
+            if rows:
+                yield limited_geometries, [take_rows(column, rows) for column in columns]
+    finally:
+        if side_file is not None:
+            side_file.close()
 
-    return output_file
+def get_wkb_size(geometry):
+    """Gets the size in bytes of an EWKB geometry
+
+    :param geometry: EWKB geometry as hex string or bytes
+    :return: Size in bytes
+    """
+    if isinstance(geometry, str):
+        return len(geometry) // 2
+    return len(geometry)
+
+def split_geometry(geometry, max_size, max_depth=16):
+    """Splits a geometry in pieces whose EWKB is not larger than max_size. The bounding box 
+    of the geometry is halved along its longest side, recursively, forming a grid of 
+    cells adapted to the density of vertices, and the geometry is clipped with each cell.
+    The clipped pieces keep only the parts with the dimension of the original geometry.
+
+    :param geometry: Shapely geometry
+    :param max_size: Maximum size in bytes
+    :param max_depth: Maximum number of recursive splits
+    :return: List of geometries
+    """
+    # 4 more bytes for the SRID
+    if len(wkb.dumps(geometry)) + 4 <= max_size or max_depth == 0:
+        return [geometry]
+    minx, miny, maxx, maxy = geometry.bounds
+    if maxx - minx >= maxy - miny:
+        middle = (minx + maxx) / 2
+        cells = [box(minx, miny, middle, maxy), box(middle, miny, maxx, maxy)]
+    else:
+        middle = (miny + maxy) / 2
+        cells = [box(minx, miny, maxx, middle), box(minx, middle, maxx, maxy)]
+    pieces = []
+    for cell in cells:
+        piece = get_parts_of_dimension(
+            geometry.intersection(cell), 
+            GEOMETRY_DIMENSIONS.get(geometry.geom_type)
+        )
+        if piece is not None:
+            pieces += split_geometry(piece, max_size, max_depth - 1)
+    return pieces
+
+def get_parts_of_dimension(geometry, dimension):
+    """Gets the parts of a geometry with a given dimension. Clipping a polygon can 
+    also return the lines and points where it touches the clipping box
+
+    :param geometry: Shapely geometry
+    :param dimension: 0 for points, 1 for lines and 2 for polygons
+    :return: Geometry with the parts of the dimension, None if there are none
+    """
+    if geometry.is_empty:
+        return None
+    if GEOMETRY_DIMENSIONS.get(geometry.geom_type) == dimension:
+        return geometry
+    parts = [
+        single
+        for part in getattr(geometry, 'geoms', [])
+        if GEOMETRY_DIMENSIONS.get(part.geom_type) == dimension and not part.is_empty
+        for single in getattr(part, 'geoms', [part])
+    ]
+    if not parts:
+        return None
+    if len(parts) == 1:
+        return parts[0]
+    return {0: MultiPoint, 1: MultiLineString, 2: MultiPolygon}[dimension](parts)
+
+def simplify_geometry(geometry, max_size, max_steps=32):
+    """Simplifies a geometry until its EWKB is not larger than max_size, starting with a 
+    tolerance of a millionth of its size and doubling it while it does not fit
+
+    :param geometry: Shapely geometry
+    :param max_size: Maximum size in bytes
+    :param max_steps: Maximum number of simplifications
+    :return: Simplified geometry
+    """
+    minx, miny, maxx, maxy = geometry.bounds
+    tolerance = max(maxx - minx, maxy - miny) / 1e6
+    simplified = geometry
+    for _ in range(max_steps):
+        simplified = geometry.simplify(tolerance, preserve_topology=True)
+        # 4 more bytes for the SRID
+        if len(wkb.dumps(simplified)) + 4 <= max_size:
+            break
+        tolerance *= 2
+    return simplified
+
+def sort_batches(batches, sort_memory=512 * 1024 * 1024, batch_size=65536):
+    """Sorts the features by their spatial key with an external merge sort, so the rows 
+    are written ordered along the Hilbert curve and each block of the loaded table 
+    covers a compact area. The features are sorted in runs that fit in sort_memory, 
+    the runs that do not fit are written to temporary files and then merged.
+
+    :param batches: Generator returned by read_batches() with a spatial_key property
+    :param sort_memory: Approximate memory in bytes used for sorting each run
+    :param batch_size: Number of features per sorted batch
+    :return: Generator like read_batches() yielding the features sorted by spatial key.
+             Features without key (empty geometries) are yielded last
+    """
+    metadata = next(batches)
+    key_index = list(metadata['schema']['properties'].keys()).index('spatial_key')
+    yield metadata
+
+    with tempfile.TemporaryDirectory(prefix="geo2rs-sort-") as temp_dir:
+        run_files = []
+        run = []
+        run_memory = 0
+        for geometries, columns in batches:
+            values = [get_csv_values(column) for column in columns]
+            for row in zip(geometries, *values):
+                run.append(row)
+                # Size of the geometry and an estimate of the size of the rest of the row
+                run_memory += len(row[0]) + 64 * len(row)
+            if run_memory >= sort_memory:
+                run_files.append(write_sort_run(run, key_index, temp_dir, len(run_files)))
+                run = []
+                run_memory = 0
+
+        run.sort(key=lambda row: get_sort_key(row, key_index))
+        if run_files:
+            run_files.append(write_sort_run(run, key_index, temp_dir, len(run_files)))
+            rows = heapq.merge(
+                *[read_sort_run(run_file) for run_file in run_files], 
+                key=lambda row: get_sort_key(row, key_index)
+            )
+        else:
+            # All the features fit in memory
+            rows = iter(run)
+
+        while True:
+            sorted_rows = [row for _, row in zip(range(batch_size), rows)]
+            if not sorted_rows:
+                break
+            columns = [list(column) for column in zip(*sorted_rows)]
+            yield columns[0], columns[1:]
+
+def get_sort_key(row, key_index):
+    """Gets the sort key of a row of sort_batches(), placing the rows without key last
+
+    :param row: Tuple with the geometry and the property values
+    :param key_index: Index of the spatial_key property
+    :return: Sort key
+    """
+    key = row[key_index + 1]
+    return (key is None, key or 0)
+
+def write_sort_run(run, key_index, temp_dir, number):
+    """Sorts a run of rows and writes it to a temporary file in chunks
+
+    :param run: List of rows
+    :param key_index: Index of the spatial_key property
+    :param temp_dir: Directory of the temporary files
+    :param number: Number of the run
+    :return: Path of the run file
+    """
+    run.sort(key=lambda row: get_sort_key(row, key_index))
+    run_file = os.path.join(temp_dir, "run{0:05d}".format(number))
+    with open(run_file, "wb") as file:
+        for start in range(0, len(run), 4096):
+            pickle.dump(run[start:start + 4096], file, protocol=pickle.HIGHEST_PROTOCOL)
+    return run_file
+
+def read_sort_run(run_file):
+    """Reads the rows of a run file written by write_sort_run(), one chunk at a time
+
+    :param run_file: Path of the run file
+    :return: Generator of rows
+    """
+    with open(run_file, "rb") as file:
+        while True:
+            try:
+                chunk = pickle.load(file)
+            except EOFError:
+                return
+            yield from chunk
+
+def write_csv(batches, file, header=True):
+    """Writes the CSV rows with EWKB geometries to a file object
+
+    :param batches: Generator returned by read_batches()
+    :param file: Text file object where the rows are written
+    :param header: If True, writes the header row
+    :return: Metadata dictionary of the written features
+    """
+    metadata = next(batches)
+    writer = csv.writer(file, delimiter=",", lineterminator="\n")
+    # Written even if no feature is, i.e. all of them are skipped, because COPY 
+    # ignores the first line of the parts concatenated after it
+    if header:
+        writer.writerow(['geom'] + list(metadata['schema']['properties'].keys()))
+    for geometries, columns in batches:
+        writer.writerows(zip(geometries, *[get_csv_values(column) for column in columns]))
+    return metadata
+
+def get_csv_values(column):
+    """Converts a property column to the values written by csv.writer for Fiona properties.
+    Fiona returns dates, times and datetimes as ISO 8601 strings.
+
+    :param column: List of values or Arrow array
+    :return: List of values
+    """
+    if isinstance(column, list):
+        return column
+    values = column.to_pylist()
+    if any(isinstance(value, (datetime.date, datetime.time)) for value in values):
+        values = [
+            get_iso_value(value) if isinstance(value, (datetime.date, datetime.time)) else value
+            for value in values
+        ]
+    return values
 
-def upload_file_s3(file_name, bucket):
-    """Upload a file to an S3 bucket
+def get_iso_value(value):
+    """Formats a date, time or datetime read with pyogrio like Fiona does.
+    pyogrio returns the datetimes of the formats storing them in UTC, i.e. GeoPackage, 
+    with the UTC timezone, that Fiona does not write.
+
+    :param value: datetime.date, datetime.time or datetime.datetime
+    :return: ISO 8601 string
+    """
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value.isoformat()
+
+def write_parquet(batches, output_file, compression=None, field_types=None):
+    """Creates a Parquet file with the geometries stored as EWKB binary and
+    the properties as typed columns derived from get_field_mappings(). Requires pyarrow.
+
+    :param batches: Generator returned by read_batches() with binary geometries
+    :param output_file: Path of the Parquet file to write
+    :param compression: Column compression codec, "gzip" or "zstd". By default, snappy
+    :param field_types: Redshift data types of some fields, see get_field_mappings()
+    :return: Metadata dictionary of the written features
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if compression not in (None, "gzip", "zstd"):
+        raise ValueError("Unsupported Parquet compression: {0}".format(compression))
+
+    metadata = next(batches)
+    field_mappings = get_field_mappings(metadata['schema'], field_types)
+    property_types = [get_arrow_type(field_mappings[field]) for field in field_mappings]
+    arrow_schema = pa.schema(
+        [pa.field('geom', pa.binary())] +
+        [pa.field(field, arrow_type) for field, arrow_type in zip(field_mappings, property_types)]
+    )
+
+    with pq.ParquetWriter(output_file, arrow_schema, compression=compression or "snappy") as writer:
+        for geometries, columns in batches:
+            arrays = [pa.array(geometries, type=pa.binary())]
+            for values, arrow_type in zip(columns, property_types):
+                arrays.append(get_arrow_values(values, arrow_type))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=arrow_schema))
+
+    return metadata
+
+def get_arrow_type(redshift_type):
+    """Maps a Redshift data type returned by get_field_mappings() to an Arrow data type
+
+    :param redshift_type: Redshift data type
+    :return: Arrow data type
+    """
+    import pyarrow as pa
+
+    if redshift_type.startswith('VARCHAR'):
+        return pa.string()
+    return {
+        'SMALLINT': pa.int16(),
+        'INTEGER': pa.int32(),
+        'BIGINT': pa.int64(),
+        'REAL': pa.float32(),
+        'DOUBLE PRECISION': pa.float64(),
+        'BOOLEAN': pa.bool_(),
+        'DATE': pa.date32(),
+        'TIME': pa.time64('us'),
+        'TIMESTAMP': pa.timestamp('us')
+    }[redshift_type]
+
+def get_arrow_values(values, arrow_type):
+    """Converts the values of a property to an Arrow array. 
+    Fiona returns dates, times and datetimes as ISO 8601 strings.
+
+    :param values: List of values or Arrow array
+    :param arrow_type: Arrow data type
+    :return: Arrow array
+    """
+    import pyarrow as pa
+
+    if isinstance(values, (pa.Array, pa.ChunkedArray)):
+        return values.cast(arrow_type)
+    parse = None
+    if pa.types.is_date(arrow_type):
+        parse = datetime.date.fromisoformat
+    elif pa.types.is_time(arrow_type):
+        parse = datetime.time.fromisoformat
+    elif pa.types.is_timestamp(arrow_type):
+        parse = datetime.datetime.fromisoformat
+    if parse is not None:
+        values = [parse(value) if isinstance(value, str) else value for value in values]
+    return pa.array(values, type=arrow_type)
+
+def upload_file_s3(file_name, bucket, chunk_size=None, max_concurrency=None, max_bandwidth=None,
+                   on_progress=None):
+    """Upload a file to an S3 bucket.
+    Files larger than the chunk size are uploaded in parts by several threads.
+
+    :param file_name: File to upload
+    :param bucket: Bucket to upload to
+    :param chunk_size: Size in bytes of each part of the multipart upload (boto3 default 8 MB)
+    :param max_concurrency: Number of threads uploading parts (boto3 default 10)
+    :param max_bandwidth: Maximum bandwidth in bytes per second. By default, unlimited
+    :param on_progress: Function called with the progress events of the upload, 
+                        see get_upload_progress_callback()
+    :return: True if file was uploaded, else False
+    """
+
+    config_options = {}
+    if chunk_size:
+        config_options['multipart_threshold'] = chunk_size
+        config_options['multipart_chunksize'] = chunk_size
+    if max_concurrency:
+        config_options['max_concurrency'] = max_concurrency
+    if max_bandwidth:
+        config_options['max_bandwidth'] = max_bandwidth
+    config = TransferConfig(**config_options)
+
+    s3_client = get_client('s3')
+    try:
+        start = time.perf_counter()
+        callback = None
+        if on_progress:
+            callback = get_upload_progress_callback(file_name, on_progress, start, 
+                                                    os.path.getsize(file_name))
+        response = s3_client.upload_file(file_name, bucket, file_name, Config=config, 
+                                         Callback=callback)
+        elapsed = time.perf_counter() - start
+    except ClientError as e:
+        logging.error(e)
+        return False
+    if on_progress:
+        on_progress(get_progress_event('upload', file_name, start, True, 
+                                       os.path.getsize(file_name), 
+                                       bytes=os.path.getsize(file_name)))
+    size = os.path.getsize(file_name) / 1024 / 1024
+    logging.info(
+        "Uploaded %s: %.1f MB in %.2f s (%.1f MB/s)", 
+        file_name, 
+        size, 
+        elapsed, 
+        size / elapsed if elapsed > 0 else 0
+    )
+    return True
+
+def get_upload_progress_callback(file_name, on_progress, start, total, interval=1.0):
+    """Creates a transfer callback that reports the progress of an upload. 
+    It is called by the threads uploading the parts with the bytes sent since the 
+    previous call, so the bytes are accumulated with a lock.
+
+    :param file_name: Uploaded file
+    :param on_progress: Function called with each progress event, see get_progress_event()
+    :param start: perf_counter() value when the upload started
+    :param total: Number of bytes to upload, used for the ETA
+    :param interval: Minimum seconds between events
+    :return: Function receiving the number of bytes transferred
+    """
+    lock = threading.Lock()
+    progress = {'bytes': 0, 'reported': start}
+
+    def callback(bytes_transferred):
+        with lock:
+            progress['bytes'] += bytes_transferred
+            now = time.perf_counter()
+            if now - progress['reported'] < interval:
+                return
+            progress['reported'] = now
+            event = get_progress_event('upload', file_name, start, False, total, 
+                                       bytes=progress['bytes'])
+        on_progress(event)
+
+    return callback
+
+def upload_file_s3_resumable(file_name, bucket, checkpoint, on_checkpoint=None, chunk_size=None,
+                             max_concurrency=None, on_progress=None):
+    """Upload a file to an S3 bucket with a multipart upload that can be resumed.
+    The upload id and the ETag of each uploaded part are recorded in checkpoint, so
+    a failed upload is resumed from the parts already stored in S3.
 
     :param file_name: File to upload
     :param bucket: Bucket to upload to
-    :return: True if file was uploaded, else False
+    :param checkpoint: Dictionary with the state of the upload, empty for a new upload
+    :param on_checkpoint: Function called without arguments after checkpoint is updated
+    :param chunk_size: Size in bytes of each part (default 8 MB). A resumed upload keeps 
+                       the size of its first attempt
+    :param max_concurrency: Number of threads uploading parts (default 10)
+    :param on_progress: Function called with the progress events of the upload. 
+                        The parts uploaded by a previous attempt are not counted
+    :return: True if file was uploaded, else False
+    """
+
+    if chunk_size and chunk_size < MIN_PART_SIZE:
+        raise ValueError("The parts of a multipart upload must be at least 5 MB")
+    if checkpoint.get('complete'):
+        return True
+    on_checkpoint = on_checkpoint or (lambda: None)
+    chunk_size = checkpoint.setdefault('chunk_size', chunk_size or 8 * 1024 * 1024)
+    size = os.path.getsize(file_name)
+    s3_client = get_client('s3')
+    uploaded = size
+    try:
+        start = time.perf_counter()
+        callback = None
+        if on_progress:
+            callback = get_upload_progress_callback(file_name, on_progress, start, size)
+        if size <= chunk_size:
+            s3_client.upload_file(file_name, bucket, file_name, Callback=callback)
+        else:
+            parts = get_uploaded_parts(s3_client, bucket, file_name, checkpoint.get('upload_id'))
+            if parts is None:
+                response = s3_client.create_multipart_upload(Bucket=bucket, Key=file_name)
+                checkpoint['upload_id'] = response['UploadId']
+                parts = {}
+            elif parts:
+                logging.info("Resuming upload of %s from %d parts", file_name, len(parts))
+            checkpoint['parts'] = parts
+            uploaded = size - min(size, len(parts) * chunk_size)
+            if on_progress:
+                callback = get_upload_progress_callback(file_name, on_progress, start, uploaded)
+            on_checkpoint()
+            lock = threading.Lock()
+
+            def upload_part(part_number):
+                with open(file_name, "rb") as file:
+                    file.seek((part_number - 1) * chunk_size)
+                    body = file.read(chunk_size)
+                response = s3_client.upload_part(
+                    Bucket=bucket, 
+                    Key=file_name, 
+                    UploadId=checkpoint['upload_id'], 
+                    PartNumber=part_number, 
+                    Body=body
+                )
+                with lock:
+                    parts[str(part_number)] = response['ETag']
+                    on_checkpoint()
+                if callback:
+                    callback(len(body))
+
+            part_count = (size + chunk_size - 1) // chunk_size
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency or 10) as executor:
+                list(executor.map(
+                    upload_part,
+                    [number for number in range(1, part_count + 1) if str(number) not in parts]
+                ))
+            s3_client.complete_multipart_upload(
+                Bucket=bucket,
+                Key=file_name,
+                UploadId=checkpoint['upload_id'],
+                MultipartUpload={
+                    'Parts': [
+                        {'PartNumber': number, 'ETag': parts[str(number)]}
+                        for number in range(1, part_count + 1)
+                    ]
+                }
+            )
+        elapsed = time.perf_counter() - start
+    except ClientError as e:
+        logging.error(e)
+        return False
+    checkpoint['complete'] = True
+    on_checkpoint()
+    if on_progress:
+        on_progress(get_progress_event('upload', file_name, start, True, uploaded, bytes=uploaded))
+    logging.info("Uploaded %s: %.1f MB in %.2f s", file_name, size / 1024 / 1024, elapsed)
+    return True
+
+def get_uploaded_parts(s3_client, bucket, key, upload_id):
+    """Gets the parts already stored in S3 of a multipart upload
+
+    :param s3_client: S3 client
+    :param bucket: Bucket of the upload
+    :param key: Key of the upload
+    :param upload_id: Id of the multipart upload, or None
+    :return: Dictionary mapping part numbers (as strings) to ETags, 
+             or None if the upload does not exist anymore
+    """
+    if not upload_id:
+        return None
+    parts = {}
+    try:
+        paginator = s3_client.get_paginator('list_parts')
+        for page in paginator.paginate(Bucket=bucket, Key=key, UploadId=upload_id):
+            for part in page.get('Parts', []):
+                parts[str(part['PartNumber'])] = part['ETag']
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'NoSuchUpload':
+            return None
+        raise
+    return parts
+
+class S3MultipartWriter(io.RawIOBase):
+    """Binary file object that uploads the data written to it to S3 as a multipart upload.
+    The parts are uploaded by a pool of threads while the data is still being written. 
+    Writes block while the queue of pending parts is full, so the memory used is bounded 
+    to about max_memory.
+    """
+
+    def __init__(self, bucket, key, part_size=16 * 1024 * 1024, 
+                 max_memory=256 * 1024 * 1024, threads=4):
+        """
+        :param bucket: Bucket to upload to
+        :param key: Key of the uploaded object
+        :param part_size: Size of each part in bytes (S3 minimum is 5 MB, except for the last part)
+        :param max_memory: Maximum memory in bytes used for buffering the parts
+        :param threads: Number of threads uploading parts
+        """
+        if part_size < MIN_PART_SIZE:
+            raise ValueError("The parts of a multipart upload must be at least 5 MB")
+        super().__init__()
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        # The part being filled, the pending parts and the parts being uploaded are in memory
+        max_parts = max(3, max_memory // part_size)
+        threads = max(1, min(threads, max_parts - 2))
+        self._client = get_client('s3')
+        self._upload_id = self._client.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+        self._queue = queue.Queue(maxsize=max_parts - threads - 1)
+        self._buffer = bytearray()
+        self._part_number = 0
+        self._etags = {}
+        self._errors = []
+        self._aborted = False
+        self._threads = [
+            threading.Thread(target=self._upload_parts, daemon=True) for _ in range(threads)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self._errors:
+            raise self._errors[0]
+        self._buffer += data
+        while len(self._buffer) >= self.part_size:
+            self._put_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def _put_part(self, data):
+        self._part_number += 1
+        self._queue.put((self._part_number, data))
+
+    def _upload_parts(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            part_number, data = item
+            # Keep draining the queue after an error so the writer never blocks
+            if self._errors or self._aborted:
+                continue
+            try:
+                response = self._client.upload_part(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self._upload_id,
+                    PartNumber=part_number,
+                    Body=data
+                )
+                self._etags[part_number] = response['ETag']
+            except Exception as e:
+                self._errors.append(e)
+
+    def _stop_threads(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def close(self):
+        """Uploads the last part and completes the multipart upload"""
+        if self.closed:
+            return
+        try:
+            if self._aborted:
+                return
+            # A multipart upload needs at least one part, even if it is empty
+            if self._buffer or self._part_number == 0:
+                self._put_part(bytes(self._buffer))
+                self._buffer = bytearray()
+            self._stop_threads()
+            if self._errors:
+                self._abort_upload()
+                raise self._errors[0]
+            try:
+                self._client.complete_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self._upload_id,
+                    MultipartUpload={
+                        'Parts': [
+                            {'PartNumber': part_number, 'ETag': self._etags[part_number]}
+                            for part_number in sorted(self._etags)
+                        ]
+                    }
+                )
+            except Exception:
+                # abort() does nothing once the writer is closed, and the parts of an 
+                # incomplete upload are stored (and billed) until it is aborted
+                self._aborted = True
+                self._abort_upload()
+                raise
+        finally:
+            super().close()
+
+    def abort(self):
+        """Aborts the multipart upload discarding the parts already uploaded"""
+        if self.closed or self._aborted:
+            return
+        self._aborted = True
+        self._stop_threads()
+        self._abort_upload()
+        super().close()
+
+    def _abort_upload(self):
+        self._client.abort_multipart_upload(
+            Bucket=self.bucket, 
+            Key=self.key, 
+            UploadId=self._upload_id
+        )
+
+def transform_to_s3(file_name, bucket, key=None, engine="fiona", batch_size=65536,
+                    part_size=16 * 1024 * 1024, max_memory=256 * 1024 * 1024, threads=4,
+                    compression=None, state_file=None, id_field=None, spatial_key=None,
+                    sort_memory=None, bbox_columns=False, oversized=None, on_progress=None,
+                    precision=None, simplify_tolerance=None, preserve_topology=False,
+                    feature_count=None):
+    """Transforms the input file and streams the CSV file to S3 without writing it to disk.
+    The encoding of the features overlaps with the upload of the parts already written.
+
+    :param file_name: Input file in one of the supported geospatial formats
+    :param bucket: Bucket to upload to
+    :param key: Key of the uploaded object. By default, the path of the CSV file 
+                that transform() would write
+    :param engine: Transform engine, "fiona" or "arrow"
+    :param batch_size: Number of features per batch when using the arrow engine
+    :param part_size: Size of each part of the multipart upload in bytes
+    :param max_memory: Maximum memory in bytes used for buffering the parts
+    :param threads: Number of threads uploading parts
+    :param compression: Compress the CSV file while it is streamed: "gzip", "zstd" or "bzip2"
+    :param state_file: CSV file with the feature hashes of the previous import, see detect_changes()
+    :param id_field: Property identifying the features when state_file is set
+    :param spatial_key: True or extent to add a spatial_key property, see transform()
+    :param sort_memory: If set, sorts the features by spatial key, see sort_batches()
+    :param bbox_columns: If True, adds the bounding box properties, see transform()
+    :param oversized: Policy for the oversized geometries, see limit_geometry_size()
+    :param on_progress: Function called with the progress events of the transform, 
+                        without the bytes, see report_transform_progress()
+    :param precision: Size of the grid the coordinates are snapped to, see quantize_geometry()
+    :param simplify_tolerance: If set, simplifies the geometries, see transform()
+    :param preserve_topology: If True, the simplification keeps the geometries valid
+    :param feature_count: Number of features of the input file, used for the progress.
+                          By default, it is counted before the transform
+    :return: Dictionary with the metadata of the transformed file (see transform()) 
+             if the file was uploaded, else False
     """
 
-    s3_client = boto3.client('s3')
+    if key is None:
+        key = get_output_file_name(file_name, compression)
+    if sort_memory:
+        spatial_key = spatial_key or True
+
     try:
-        response = s3_client.upload_file(file_name, bucket, file_name)
+        sink = S3MultipartWriter(bucket, key, part_size, max_memory, threads)
     except ClientError as e:
         logging.error(e)
         return False
-    return True
+    buffer = io.BufferedWriter(sink, buffer_size=1024 * 1024)
+    file = io.TextIOWrapper(compress_writer(buffer, compression))
+    try:
+        batches = read_batches(file_name, engine, batch_size, spatial_key=spatial_key,
+                               bbox_columns=bbox_columns, precision=precision,
+                               simplify_tolerance=simplify_tolerance, 
+                               preserve_topology=preserve_topology)
+        if on_progress:
+            progress_start = time.perf_counter()
+            total = feature_count if feature_count is not None else get_feature_count(file_name)
+            batches = report_transform_progress(batches, on_progress, file_name, 
+                                                progress_start, total=total)
+        if state_file:
+            batches = detect_changes(batches, state_file, id_field, get_deleted_file_name(file_name))
+        if oversized:
+            batches = limit_geometry_size(
+                batches, 
+                oversized, 
+                get_oversized_file_name(get_output_file_name(file_name))
+            )
+        if sort_memory:
+            batches = sort_batches(batches, sort_memory, batch_size)
+        metadata = write_csv(batches, file)
+        file.close()
+        # The compressors do not close the stream they write to
+        buffer.close()
+    except Exception as e:
+        logging.error(e)
+        sink.abort()
+        return False
+    if on_progress:
+        on_progress(get_progress_event('transform', file_name, progress_start, True, total, 
+                                       features=total))
+    metadata['files'] = [key]
+    metadata['parts'] = False
+    return metadata
+
+def get_backoff_delays(initial_delay=0.1, max_delay=5.0):
+    """Generates polling delays growing exponentially up to max_delay, with jitter 
+    so many concurrent waiters do not poll the API at the same time
+
+    :param initial_delay: First delay in seconds
+    :param max_delay: Maximum delay in seconds
+    :return: Generator of delays in seconds
+    """
+    delay = initial_delay
+    while True:
+        yield random.uniform(delay / 2, delay)
+        delay = min(max_delay, delay * 2)
+
+def is_throttling_error(error):
+    """Checks if a ClientError was caused by API throttling
+
+    :param error: ClientError
+    :return: True if the request was throttled
+    """
+    return error.response.get('Error', {}).get('Code') in ('ThrottlingException', 'Throttling')
+
+def wait_for_statement(client, statement_id, timeout=None, initial_delay=0.1, max_delay=5.0,
+                       on_wait=None):
+    """Waits until a Redshift Data API statement finishes, polling its status with 
+    exponential backoff. The statement is cancelled if it does not finish before the timeout.
 
-def execute_redshift_statement(cluster_identifier, database, secret_arn, sql):
+    :param client: Redshift Data API client
+    :param statement_id: Id of the statement
+    :param timeout: Maximum time to wait in seconds. By default, waits indefinitely
+    :param initial_delay: First polling delay in seconds
+    :param max_delay: Maximum polling delay in seconds
+    :param on_wait: Function called with each describe_statement response
+    :return: The describe_statement response of the finished statement
+    """
+    start = time.monotonic()
+    for delay in get_backoff_delays(initial_delay, max_delay):
+        try:
+            response = client.describe_statement(Id=statement_id)
+            if on_wait:
+                on_wait(response)
+            if response['Status'] in ('FINISHED', 'FAILED', 'ABORTED'):
+                return response
+        except ClientError as e:
+            # Keep waiting with a longer delay if the API is throttling the requests
+            if not is_throttling_error(e):
+                raise
+        if timeout is not None:
+            remaining = timeout - (time.monotonic() - start)
+            if remaining <= 0:
+                client.cancel_statement(Id=statement_id)
+                raise TimeoutError(
+                    'Statement {0} did not finish in {1} seconds'.format(statement_id, timeout)
+                )
+            delay = min(delay, remaining)
+        time.sleep(delay)
+
+async def wait_for_statement_async(client, statement_id, timeout=None, 
+                                   initial_delay=0.1, max_delay=5.0):
+    """Waits until a Redshift Data API statement finishes without blocking the event loop.
+    Same behaviour as wait_for_statement().
+
+    :param client: Redshift Data API client
+    :param statement_id: Id of the statement
+    :param timeout: Maximum time to wait in seconds. By default, waits indefinitely
+    :param initial_delay: First polling delay in seconds
+    :param max_delay: Maximum polling delay in seconds
+    :return: The describe_statement response of the finished statement
+    """
+    start = time.monotonic()
+    for delay in get_backoff_delays(initial_delay, max_delay):
+        try:
+            response = await asyncio.to_thread(client.describe_statement, Id=statement_id)
+            if response['Status'] in ('FINISHED', 'FAILED', 'ABORTED'):
+                return response
+        except ClientError as e:
+            if not is_throttling_error(e):
+                raise
+        if timeout is not None:
+            remaining = timeout - (time.monotonic() - start)
+            if remaining <= 0:
+                await asyncio.to_thread(client.cancel_statement, Id=statement_id)
+                raise TimeoutError(
+                    'Statement {0} did not finish in {1} seconds'.format(statement_id, timeout)
+                )
+            delay = min(delay, remaining)
+        await asyncio.sleep(delay)
+
+def get_statement_records(client, statement_id, status_response, sql):
+    """Gets all the records of a finished statement, following the result pages
+
+    :param client: Redshift Data API client
+    :param statement_id: Id of the statement
+    :param status_response: The describe_statement response of the finished statement
+    :param sql: SQL statement, used in the error message
+    :return: List of records
+    """
+    if status_response['Status'] != 'FINISHED':
+        raise Exception('Error executing SQL statement: ' + sql + '\n' + status_response.get('Error', status_response['Status']))
+
+    # Check if there is a result set
+    if not status_response['HasResultSet']:
+        return []
+    result_response = client.get_statement_result(
+        Id=statement_id
+    )
+    result = result_response['Records']
+    while result_response.get('NextToken'):
+        result_response = client.get_statement_result(
+            Id=statement_id,
+            NextToken=result_response['NextToken']
+        )
+        result = result + result_response['Records']
+    return result
+
+def execute_redshift_statement(cluster_identifier, database, secret_arn, sql, timeout=None,
+                               on_wait=None):
     """Executes a SQL statement on Redshift
 
     :param cluster_identifier: Redshift cluster
     :param database: Redshift database where the statement will be executed
     :param secret_arn: ARN of the secret that enables access to the database
     :param sql: SQL statement to execute
+    :param timeout: Maximum time to wait for the statement in seconds. 
+                    The statement is cancelled and TimeoutError raised if exceeded
+    :param on_wait: Function called with each describe_statement response, see wait_for_statement()
     :return: List of records
     """
 
-    client = boto3.client('redshift-data')
+    client = get_client('redshift-data')
     try:
         # Execute the SQL statement
         query_response = client.execute_statement(
@@ -93,49 +2171,132 @@ def execute_redshift_statement(cluster_identifier, database, secret_arn, sql):
         )
 
         # Wait until execution finishes
-        result_status_response = client.describe_statement(
-            Id=query_response['Id']
-        )
-        while result_status_response['Status'] != 'FAILED' and result_status_response['Status'] != 'FINISHED':
-            result_status_response = client.describe_statement(
-                Id=query_response['Id']
-            )
-        
+        result_status_response = wait_for_statement(client, query_response['Id'], timeout, 
+                                                    on_wait=on_wait)
+
         # Process results
-        if result_status_response['Status'] == 'FAILED':
-            raise Exception('Error executing SQL statement: ' + sql + '\n' + result_status_response['Error'])
-
-        # Check if there is a result set
-        if result_status_response['Status'] == 'FINISHED':
-            if result_status_response['HasResultSet']:
-                result_response = client.get_statement_result(
-                    Id=query_response['Id']
-                )
-                result = result_response['Records']
-                while result_response['NextToken'] != "":
-                    result_response = client.get_statement_result(
-                        Id=query_response,
-                        NextToken=result_response['NextToken']
-                    )
-                    result = result + result_response['Records']
-                return result
-            else:
-                return []
+        return get_statement_records(client, query_response['Id'], result_status_response, sql)
+    except ClientError as e:
+        logging.error(e)
+        return False
+
+async def execute_redshift_statement_async(cluster_identifier, database, secret_arn, sql, 
+                                           timeout=None):
+    """Executes a SQL statement on Redshift without blocking the event loop, 
+    so many statements can be awaited concurrently, e.g. with asyncio.gather()
+
+    :param cluster_identifier: Redshift cluster
+    :param database: Redshift database where the statement will be executed
+    :param secret_arn: ARN of the secret that enables access to the database
+    :param sql: SQL statement to execute
+    :param timeout: Maximum time to wait for the statement in seconds. 
+                    The statement is cancelled and TimeoutError raised if exceeded
+    :return: List of records
+    """
+
+    client = get_client('redshift-data')
+    try:
+        query_response = await asyncio.to_thread(
+            client.execute_statement,
+            ClusterIdentifier=cluster_identifier,
+            Database=database,
+            SecretArn=secret_arn,
+            Sql=sql
+        )
+        result_status_response = await wait_for_statement_async(
+            client, 
+            query_response['Id'], 
+            timeout
+        )
+        return await asyncio.to_thread(
+            get_statement_records, 
+            client, 
+            query_response['Id'], 
+            result_status_response, 
+            sql
+        )
+    except ClientError as e:
+        logging.error(e)
+        return False
+
+def execute_redshift_transaction(cluster_identifier, database, secret_arn, sqls, timeout=None,
+                                 on_wait=None):
+    """Executes several SQL statements on Redshift as a single transaction. 
+    They run in the same session, so temporary tables are visible to all of them.
+
+    :param cluster_identifier: Redshift cluster
+    :param database: Redshift database where the statements will be executed
+    :param secret_arn: ARN of the secret that enables access to the database
+    :param sqls: List of SQL statements to execute
+    :param timeout: Maximum time to wait for the statements in seconds.
+                    The transaction is cancelled and TimeoutError raised if exceeded
+    :param on_wait: Function called with each describe_statement response, see wait_for_statement()
+    :return: True if the transaction was committed, else False
+    """
+
+    client = get_client('redshift-data')
+    try:
+        query_response = client.batch_execute_statement(
+            ClusterIdentifier=cluster_identifier,
+            Database=database,
+            SecretArn=secret_arn,
+            Sqls=sqls
+        )
+        result_status_response = wait_for_statement(client, query_response['Id'], timeout, 
+                                                    on_wait=on_wait)
+        if result_status_response['Status'] != 'FINISHED':
+            raise Exception('Error executing SQL statements: ' + '\n'.join(sqls) + '\n' + result_status_response.get('Error', result_status_response['Status']))
     except ClientError as e:
         logging.error(e)
         return False
     return True
 
-def get_field_mappings(schema):
+def get_slice_count(cluster_identifier, database, secret_arn):
+    """Gets the number of slices of a Redshift cluster.
+    Loading a multiple of this number of files lets COPY use all the slices in parallel.
+
+    :param cluster_identifier: Redshift cluster
+    :param database: Redshift database
+    :param secret_arn: ARN of the secret that enables access to the database
+    :return: Number of slices or False if the query failed
+    """
+    try:
+        result = execute_redshift_statement(
+            cluster_identifier, 
+            database, 
+            secret_arn, 
+            "SELECT COUNT(*) FROM stv_slices;"
+        )
+    except Exception as e:
+        logging.error(e)
+        return False
+    if result is False:
+        return False
+    return int(result[0][0]['longValue'])
+
+def get_field_mappings(schema, field_types=None):
     """Maps Fiona data types to Redshift data types for each in the schema
 
     :param schema: Fiona schema
+    :param field_types: Dictionary with the Redshift data type of some fields, used instead 
+                        of the default ones, i.e. the narrower types chosen by 
+                        get_profiled_field_types()
     :return: Dictionary with the data type for each field
     """
     field_mappings = OrderedDict()
     for property in schema['properties']:
         property_type = fiona.prop_type(schema['properties'][property])
-        if property_type == type(int()):
+        base_type = schema['properties'][property].split(':')[0]
+        if field_types and property in field_types:
+            field_mappings[property] = field_types[property]
+        elif base_type in ('date', 'time', 'datetime'):
+            # Fiona 1.10 returns str as the type of dates, times and datetimes
+            field_mappings[property] = {
+                'date': 'DATE', 
+                'time': 'TIME', 
+                'datetime': 'TIMESTAMP'
+            }[base_type]
+        elif property_type == type(int()):
             # Redshift data types: INTEGER, BIGINT
             field_mappings[property] = 'BIGINT'
         elif property_type == type(float()):
@@ -158,92 +2319,1316 @@ def get_field_mappings(schema):
 
     return field_mappings    
 
+# Bytes per value of the fixed size Redshift data types, used to estimate the storage savings
+TYPE_SIZES = {'SMALLINT': 2, 'INTEGER': 4, 'BIGINT': 8, 'REAL': 4, 'DOUBLE PRECISION': 8}
+
+def profile_file(file_name, engine="fiona", batch_size=65536, sample_size=None, samples=10):
+    """Scans the property values of the input file to find the range of the numbers and 
+    the length of the strings actually used, streaming the features in batches.
+
+    :param file_name: Input file in one of the supported geospatial formats
+    :param engine: Transform engine, "fiona" or "arrow"
+    :param batch_size: Number of features per batch
+    :param sample_size: Number of features to scan, read from several ranges spread 
+                        across the file. By default, all the features are scanned
+    :param samples: Number of ranges of the sample
+    :return: Dictionary with the schema, the feature_count of the file, the number of 
+             profiled features and the statistics of each property (count of non null 
+             values, min, max, max_length in bytes and real, True if all the floats 
+             are exact in single precision)
+    """
+    with fiona.open(file_name, "r") as source:
+        feature_count = len(source)
+
+    ranges = [(None, None)]
+    if sample_size and sample_size < feature_count:
+        size = max(1, sample_size // samples)
+        ranges = [
+            (start, min(start + size, stop)) 
+            for start, stop in get_feature_ranges(feature_count, samples)
+        ]
+
+    profile = {'feature_count': feature_count, 'profiled': 0, 'properties': OrderedDict()}
+    for start, stop in ranges:
+        batches = read_batches(file_name, engine, batch_size, start, stop)
+        metadata = next(batches)
+        profile['schema'] = metadata['schema']
+        fields = list(metadata['schema']['properties'].keys())
+        for field in fields:
+            profile['properties'].setdefault(field, {
+                'count': 0, 'min': None, 'max': None, 'max_length': 0, 'real': True
+            })
+        for geometries, columns in batches:
+            profile['profiled'] += len(geometries)
+            for field, column in zip(fields, columns):
+                update_property_profile(profile['properties'][field], get_csv_values(column))
+    return profile
+
+def update_property_profile(stats, values):
+    """Updates the statistics of a property with a batch of values
+
+    :param stats: Statistics of the property, see profile_file()
+    :param values: List of values
+    """
+    values = [value for value in values if value is not None and not isinstance(value, bool)]
+    stats['count'] += len(values)
+    numbers = [
+        value for value in values 
+        if isinstance(value, (int, float)) and not (isinstance(value, float) and math.isnan(value))
+    ]
+    if numbers:
+        stats['min'] = min(numbers) if stats['min'] is None else min(stats['min'], min(numbers))
+        stats['max'] = max(numbers) if stats['max'] is None else max(stats['max'], max(numbers))
+        floats = [value for value in numbers if isinstance(value, float)]
+        if stats['real'] and floats:
+            # The values that do not round trip through single precision need DOUBLE PRECISION
+            stats['real'] = array.array('f', floats).tolist() == floats
+    strings = [value for value in values if isinstance(value, str)]
+    if strings:
+        stats['max_length'] = max(stats['max_length'], max(len(value.encode('utf-8')) for value in strings))
+
+def get_profiled_field_types(profile, headroom=2.0):
+    """Chooses the narrowest Redshift data type of the integer, float and string properties
+    that holds the profiled values with some headroom, so future appends do not overflow.
+
+    :param profile: Profile returned by profile_file()
+    :param headroom: Factor applied to the largest absolute number and the longest string
+                     before choosing the type. The strings are never wider than the width 
+                     declared by the source, if any
+    :return: Dictionary with the Redshift data type of each profiled property, 
+             see get_field_mappings()
+    """
+    default_mappings = get_field_mappings(profile['schema'])
+    field_types = OrderedDict()
+    for field, stats in profile['properties'].items():
+        default_type = default_mappings[field]
+        if not stats['count']:
+            continue
+        if default_type == 'BIGINT' and stats['min'] is not None:
+            bound = max(abs(stats['min']), abs(stats['max'])) * headroom
+            if bound <= 32767:
+                field_types[field] = 'SMALLINT'
+            elif bound <= 2147483647:
+                field_types[field] = 'INTEGER'
+        elif default_type == 'DOUBLE PRECISION' and stats['min'] is not None:
+            bound = max(abs(stats['min']), abs(stats['max'])) * headroom
+            if stats['real'] and bound < 3.4e38:
+                field_types[field] = 'REAL'
+        elif default_type.startswith('VARCHAR'):
+            length = max(1, int(math.ceil(stats['max_length'] * headroom)))
+            # The values cannot have more characters than the width declared by the source, 
+            # so the headroom is only needed when it is unknown. The VARCHAR length is in 
+            # bytes, it is never shorter than the longest UTF-8 value found
+            declared_width = profile['schema']['properties'][field].partition(':')[2]
+            if declared_width:
+                length = min(length, max(int(declared_width), stats['max_length']))
+            length = min(length, 65535)
+            field_types[field] = 'VARCHAR({0})'.format(length)
+    return field_types
+
+def get_storage_savings(profile, field_types):
+    """Estimates the storage saved by the profiled data types, before column compression
+
+    :param profile: Profile returned by profile_file()
+    :param field_types: Data types returned by get_profiled_field_types()
+    :return: List of dictionaries with the field, the default and profiled types and the
+             estimated bytes saved for all the features of the file. The VARCHAR columns 
+             store the actual length of the values, their narrower width only reduces 
+             the memory used by the queries
+    """
+    default_mappings = get_field_mappings(profile['schema'])
+    scale = profile['feature_count'] / float(max(profile['profiled'], 1))
+    report = []
+    for field, default_type in default_mappings.items():
+        profiled_type = field_types.get(field, default_type)
+        saved = 0
+        if default_type in TYPE_SIZES and profiled_type in TYPE_SIZES:
+            saved = (TYPE_SIZES[default_type] - TYPE_SIZES[profiled_type]) * \
+                profile['properties'][field]['count'] * scale
+        report.append({
+            'field': field, 
+            'default_type': default_type, 
+            'profiled_type': profiled_type, 
+            'saved_bytes': int(saved)
+        })
+    return report
+
+def print_storage_savings(report):
+    """Prints the data types chosen by the profiler and the estimated savings
 
-def get_create_table_statement(file_name, table_name):
+    :param report: List returned by get_storage_savings()
+    """
+    print("{0:<24}{1:>20}{2:>20}{3:>14}".format("field", "default", "profiled", "saved MB"))
+    for row in report:
+        print("{0:<24}{1:>20}{2:>20}{3:>14.1f}".format(
+            row['field'], 
+            row['default_type'], 
+            row['profiled_type'], 
+            row['saved_bytes'] / 1024 / 1024
+        ))
+    print("Estimated storage saved: {0:.1f} MB".format(
+        sum(row['saved_bytes'] for row in report) / 1024 / 1024
+    ))
+
+
+def get_create_table_statement(file_name, table_name, schema=None, diststyle=None, distkey=None,
+                               sortkey=None, encodings=None, field_types=None):
     """Gets the SQL CREATE TABLE statement from the input file schema
 
     :param file_name: Input file
     :param table_name: Name of the table that will be created
+    :param schema: Fiona schema of the input file, as returned by transform(). 
+                   If it is not provided, it is read from the input file
+    :param diststyle: Distribution style: "AUTO", "EVEN", "KEY" or "ALL"
+    :param distkey: Distribution key column
+    :param sortkey: List of columns of the compound sort key. Use ["spatial_key"] 
+                    with the spatial key added by transform() to sort the rows by location
+    :param encodings: Dictionary with the compression encoding of each column 
+                      (i.e. {"name": "ZSTD"}). The rest use the Redshift default
+    :param field_types: Data types of some fields, see get_profiled_field_types()
     :return: CREATE TABLE statement
     """
-    with fiona.open(file_name, "r") as source:
-        schema = source.schema
+    if schema is None:
+        with fiona.open(file_name, "r") as source:
+            schema = source.schema
 
-    field_mappings = get_field_mappings(schema)
-    fields = "geom GEOMETRY, ";
-    for field in field_mappings:
-        fields += field + " " + field_mappings[field] + ", "
-    fields = fields[:-2]  # Remove the last ", "
+    encodings = encodings or {}
+    columns = [('geom', 'GEOMETRY')] + list(get_field_mappings(schema, field_types).items())
+    fields = ", ".join(
+        "{0} {1}{2}".format(
+            field, 
+            data_type, 
+            " ENCODE " + encodings[field] if field in encodings else ""
+        )
+        for field, data_type in columns
+    )
 
     statement = "CREATE TABLE {0}({1})".format(table_name, fields)
+    if diststyle:
+        statement += " DISTSTYLE " + diststyle.upper()
+    if distkey:
+        statement += " DISTKEY({0})".format(distkey)
+    if sortkey:
+        statement += " SORTKEY({0})".format(", ".join(sortkey))
                 
     return statement
 
+def get_copy_format_options(file_format="csv", compression=None):
+    """Gets the data format options of the COPY statement
+
+    :param file_format: "csv" or "parquet"
+    :param compression: Compression of the CSV files: "gzip", "zstd" or "bzip2"
+    :return: COPY options
+    """
+    if file_format == "parquet":
+        # The compression is internal to the Parquet files
+        return "FORMAT AS PARQUET"
+    return ("{0}FORMAT CSV IGNOREHEADER 1 "
+            "TIMEFORMAT 'YYYY-MM-DDTHH:MI:SS'").format(
+                compression.upper() + " " if compression else ""
+            )
+
+def get_copy_statement(table_name, csv_file_path, redshift_role_arn, manifest=False,
+                       compression=None, file_format="csv"):
+    """Gets the COPY statement that loads the data from S3
+
+    :param table_name: Redshift table where the data will be loaded
+    :param csv_file_path: S3 path of the file, prefix or manifest
+    :param redshift_role_arn: ARN of the Redshift role with read access to S3
+    :param manifest: If True, csv_file_path is a manifest listing the files to load
+    :param compression: Compression of the CSV files: "gzip", "zstd" or "bzip2"
+    :param file_format: "csv" or "parquet"
+    :return: COPY statement
+    """
+    return ("COPY {0} FROM '{1}' " 
+            "IAM_ROLE '{2}' "
+            "{3}{4};").format(
+                table_name, 
+                csv_file_path, 
+                redshift_role_arn, 
+                "MANIFEST " if manifest else "",
+                get_copy_format_options(file_format, compression)
+            )
+
+def get_merge_statements(table_name, copy_statement, staging_table_name, mode="append", 
+                         upsert_key=None):
+    """Gets the statements that load the data into a staging table and merge it 
+    into an existing table. They must be executed as a single transaction.
+
+    :param table_name: Existing Redshift table
+    :param copy_statement: COPY statement loading the data into the staging table
+    :param staging_table_name: Name of the temporary staging table
+    :param mode: "append" inserts all the rows, "upsert" first deletes the rows of 
+                 the table with the same key as any of the new rows
+    :param upsert_key: Column identifying the rows in upsert mode
+    :return: List of SQL statements
+    """
+    statements = [
+        "CREATE TEMP TABLE {0} (LIKE {1});".format(staging_table_name, table_name),
+        copy_statement
+    ]
+    if mode == "upsert":
+        statements.append(
+            "DELETE FROM {0} USING {1} WHERE {0}.{2} = {1}.{2};".format(
+                table_name, 
+                staging_table_name, 
+                upsert_key
+            )
+        )
+    statements.append("INSERT INTO {0} SELECT * FROM {1};".format(table_name, staging_table_name))
+    statements.append("DROP TABLE {0};".format(staging_table_name))
+    return statements
+
+def get_delete_statements(table_name, deleted_file_path, redshift_role_arn, deleted_table_name, 
+                          key):
+    """Gets the statements that delete the rows listed in a CSV file uploaded to S3.
+    They are executed in the same transaction as the merge statements.
+
+    :param table_name: Existing Redshift table
+    :param deleted_file_path: S3 path of the CSV file with the keys of the deleted rows
+    :param redshift_role_arn: ARN of the Redshift role with read access to S3
+    :param deleted_table_name: Name of the temporary table where the keys are loaded
+    :param key: Column identifying the rows
+    :return: List of SQL statements
+    """
+    return [
+        # Same column type as the key of the table
+        "CREATE TEMP TABLE {0} AS SELECT {1} FROM {2} LIMIT 0;".format(
+            deleted_table_name, 
+            key, 
+            table_name
+        ),
+        get_copy_statement(deleted_table_name, deleted_file_path, redshift_role_arn),
+        "DELETE FROM {0} USING {1} WHERE {0}.{2} = {1}.{2};".format(
+            table_name, 
+            deleted_table_name, 
+            key
+        ),
+        "DROP TABLE {0};".format(deleted_table_name)
+    ]
+
 def import_file_redshift(original_file_name, 
                          csv_file_path, 
                          cluster_identifier, 
                          database,
                          table_name, 
                          secret_arn,
-                         redshift_role_arn):
+                         redshift_role_arn,
+                         manifest=False,
+                         compression=None,
+                         file_format="csv",
+                         timeout=None,
+                         schema=None,
+                         mode="create",
+                         upsert_key=None,
+                         deleted_file_path=None,
+                         checkpoint=None,
+                         on_checkpoint=None,
+                         table_options=None,
+                         on_progress=None,
+                         profiler=None):
     """Import a CSV file into Redshift with EWKB geometries using COPY
 
     :param file_name: CSV file to import
-    :param csv_file_path: S3 path where the CSV file is located
+    :param csv_file_path: S3 path where the CSV file is located. It can also be a 
+                          prefix shared by several CSV files or a manifest file
     :param cluster_identifier: Redshift cluster
     :param database: Redshift database where the data will be imported
     :param table_name: Redshift table where the data will be imported
     :param secret_arn: ARN of the secret that enables access to the database
     :param redshift_role_arn: ARN of the Redshift role with read access to S3
+    :param manifest: If True, csv_file_path is a manifest listing the CSV files to load
+    :param compression: Compression of the CSV files: "gzip", "zstd" or "bzip2"
+    :param file_format: "csv" or "parquet"
+    :param timeout: Maximum time in seconds to wait for each statement
+    :param schema: Fiona schema of the input file, as returned by transform(), 
+                   so the input file does not need to be opened again
+    :param mode: "create" creates the table and loads the data into it. 
+                 "append" and "upsert" load the data into an existing table through 
+                 a temporary staging table, merging it in a single transaction
+    :param upsert_key: Column identifying the rows in upsert mode. The existing rows 
+                       with the same key as a new row are replaced
+    :param deleted_file_path: S3 path of a CSV file with the keys of the rows to delete
+                              in upsert mode, written by detect_changes()
+    :param checkpoint: Dictionary where the completed statements are recorded 
+                       (create_table and copy). The recorded ones are not executed again
+    :param on_checkpoint: Function called without arguments after checkpoint is updated
+    :param table_options: Dictionary with the diststyle, distkey, sortkey, encodings and
+                          field_types of the created table, see get_create_table_statement()
+    :param on_progress: Function called with the progress events of COPY, see get_copy_progress_callback()
+    :param profiler: StageProfiler profiling CREATE TABLE as the "ddl" stage and COPY as 
+                     the "copy" stage. In append and upsert modes, the whole transaction 
+                     is the "copy" stage
     :return: True if file was imported, else False
     """
 
+    if checkpoint is None:
+        checkpoint = {}
+    on_checkpoint = on_checkpoint or (lambda: None)
+    if checkpoint.get('copy'):
+        return True
+    on_wait = None
+    if on_progress:
+        on_wait = get_copy_progress_callback(csv_file_path, on_progress, time.perf_counter())
+
     try:
+        if mode in ("append", "upsert"):
+            if mode == "upsert" and not upsert_key:
+                raise ValueError("A key column is required in upsert mode")
+            # Temporary tables cannot be created in a schema
+            staging_table_name = table_name.split('.')[-1] + "_staging"
+            statements = get_merge_statements(
+                table_name,
+                get_copy_statement(staging_table_name, csv_file_path, redshift_role_arn, 
+                                   manifest, compression, file_format),
+                staging_table_name,
+                mode,
+                upsert_key
+            )
+            if mode == "upsert" and deleted_file_path:
+                statements += get_delete_statements(
+                    table_name,
+                    deleted_file_path,
+                    redshift_role_arn,
+                    table_name.split('.')[-1] + "_deleted",
+                    upsert_key
+                )
+            with profile_stage(profiler, "copy"):
+                committed = execute_redshift_transaction(
+                    cluster_identifier,
+                    database,
+                    secret_arn,
+                    statements,
+                    timeout,
+                    on_wait
+                )
+            if not committed:
+                return False
+            checkpoint['copy'] = True
+            on_checkpoint()
+            return True
+
         # Create table
-        result = execute_redshift_statement(
-            cluster_identifier, 
-            database,
-            secret_arn, 
-            get_create_table_statement(original_file_name, table_name)
-        )
+        if not checkpoint.get('create_table'):
+            with profile_stage(profiler, "ddl"):
+                result = execute_redshift_statement(
+                    cluster_identifier, 
+                    database,
+                    secret_arn, 
+                    get_create_table_statement(original_file_name, table_name, schema, 
+                                               **(table_options or {})),
+                    timeout
+                )
+            if result is False:
+                return False
+            checkpoint['create_table'] = True
+            on_checkpoint()
         # Load the data using COPY
-        result = execute_redshift_statement(
-            cluster_identifier, 
-            database,
-            secret_arn, 
-            ("COPY {0} FROM '{1}' " 
-             "IAM_ROLE '{2}' "
-             "FORMAT CSV IGNOREHEADER 1 "
-             "TIMEFORMAT 'YYYY-MM-DDTHH:MI:SS';").format(table_name, csv_file_path, redshift_role_arn)
-        )
+        with profile_stage(profiler, "copy"):
+            result = execute_redshift_statement(
+                cluster_identifier, 
+                database,
+                secret_arn, 
+                get_copy_statement(table_name, csv_file_path, redshift_role_arn, 
+                                   manifest, compression, file_format),
+                timeout,
+                on_wait
+            )
+        if result is False:
+            return False
+        checkpoint['copy'] = True
+        on_checkpoint()
     except Exception as e:
         logging.error(e)
         return False
     return True
 
+def get_copy_progress_callback(csv_file_path, on_progress, start):
+    """Creates the function that reports the progress of COPY while its statement is polled.
+    Redshift does not report the progress of a running COPY, so the events only have 
+    the elapsed time until it finishes. The last one has the rows loaded.
+
+    :param csv_file_path: S3 path loaded by COPY
+    :param on_progress: Function called with each progress event, see get_progress_event()
+    :param start: perf_counter() value when the import started
+    :return: Function receiving the describe_statement responses, see wait_for_statement()
+    """
+    def on_wait(response):
+        done = response['Status'] in ('FINISHED', 'FAILED', 'ABORTED')
+        event = get_progress_event('copy', csv_file_path, start, done, 
+                                   rows=get_loaded_rows(response) if done else None)
+        event['status'] = response['Status']
+        on_progress(event)
+
+    return on_wait
+
+def get_loaded_rows(response):
+    """Gets the rows loaded by COPY from the describe_statement response of the COPY 
+    statement or of the transaction that includes it
+
+    :param response: describe_statement response
+    :return: Number of rows, or None if not available
+    """
+    rows = response.get('ResultRows')
+    for statement in response.get('SubStatements', []):
+        if statement.get('QueryString', '').lstrip().upper().startswith('COPY'):
+            rows = statement.get('ResultRows')
+            break
+    return rows if rows is not None and rows >= 0 else None
+
+def print_progress(event, file=None):
+    """Renders a progress event as a progress line, overwritten by the next event of the 
+    same stage
+
+    :param event: Progress event, see get_progress_event()
+    :param file: Text file where the line is written. By default, standard error
+    """
+    file = file or sys.stderr
+    line = "{0:<9} {1}: {2:.1f} s".format(event['stage'], os.path.basename(event['file']), 
+                                          event['elapsed'])
+    if 'percent' in event:
+        line += " {0:5.1f}%".format(event['percent'])
+    for name in ('features', 'bytes', 'rows'):
+        if event.get(name) is not None:
+            if name == 'bytes':
+                line += " {0:.1f} MB ({1:.1f} MB/s)".format(
+                    event['bytes'] / 1024 / 1024, 
+                    event['bytes_per_second'] / 1024 / 1024
+                )
+            else:
+                line += " {0} {1} ({2:.0f}/s)".format(event[name], name, 
+                                                      event[name + '_per_second'])
+    if not event['done'] and event.get('eta') is not None:
+        line += " ETA {0:.0f} s".format(event['eta'])
+    file.write("\r\033[K" + line + ("\n" if event['done'] else ""))
+    file.flush()
+
+def get_progress_handler(progress_bar=False, progress_file=None):
+    """Creates the function that handles the progress events of main()
+
+    :param progress_bar: If True, the events are rendered with print_progress()
+    :param progress_file: File where the events are appended as JSON lines
+    :return: Function receiving the progress events
+    """
+    lock = threading.Lock()
+
+    def on_progress(event):
+        # The uploads report their progress from several threads
+        with lock:
+            if progress_bar:
+                print_progress(event)
+            if progress_file:
+                with open(progress_file, "a") as file:
+                    file.write(json.dumps(event) + "\n")
+
+    return on_progress
+
+class StageProfiler:
+    """Profiles each stage of an import separately. For each stage, the CPU profile is 
+    written as <stage>.pstats (cProfile) and <stage>.collapsed (collapsed stacks for 
+    flamegraph.pl or speedscope), and the memory still allocated at its end as 
+    <stage>.tracemalloc (tracemalloc snapshot). Only the calling process is profiled, 
+    not the processes of a parallel transform. Tracing the allocations slows down the 
+    stages, so the elapsed times are only comparable between profiled runs.
+    """
+
+    def __init__(self, directory, top=10):
+        """
+        :param directory: Directory where the profiles are written
+        :param top: Number of functions and allocation sites in the summary of each stage
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.top = top
+        self.stages = []
+        self._names = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Profiles the code run inside the with block as a stage
+
+        :param name: Name of the stage, used for the file names. If a stage is 
+                     profiled several times, a number is added to the name
+        """
+        count = self._names.count(name)
+        self._names.append(name)
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - start
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if not tracing:
+                tracemalloc.stop()
+            self.stages.append(self.write_profiles(
+                name if not count else "{0}_{1}".format(name, count + 1), 
+                elapsed, 
+                profile, 
+                snapshot, 
+                peak
+            ))
+
+    def write_profiles(self, name, elapsed, profile, snapshot, peak):
+        """Writes the profiles of a stage and summarizes them
+
+        :param name: Name of the stage
+        :param elapsed: Duration of the stage in seconds
+        :param profile: cProfile.Profile of the stage
+        :param snapshot: tracemalloc snapshot taken at the end of the stage
+        :param peak: Peak memory traced during the stage in bytes
+        :return: Dictionary with the stage, elapsed, peak_memory, the top functions by 
+                 own time (function, calls, own and cumulative time) and the top 
+                 allocation sites (line, size and count)
+        """
+        path = os.path.join(self.directory, name)
+        profile.dump_stats(path + ".pstats")
+        stats = pstats.Stats(profile).stats
+        with open(path + ".collapsed", "w") as file:
+            for stack, microseconds in get_collapsed_stacks(stats).items():
+                file.write("{0} {1}\n".format(stack, microseconds))
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>")
+        ])
+        snapshot.dump(path + ".tracemalloc")
+        functions = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)
+        return OrderedDict([
+            ('stage', name),
+            ('elapsed', elapsed),
+            ('peak_memory', peak),
+            ('functions', [
+                OrderedDict([
+                    ('function', get_function_label(function)), 
+                    ('calls', calls), 
+                    ('time', own_time), 
+                    ('cumulative_time', cumulative_time)
+                ])
+                for function, (_, calls, own_time, cumulative_time, _) in functions[:self.top]
+            ]),
+            ('allocations', [
+                OrderedDict([
+                    ('line', str(statistic.traceback)), 
+                    ('size', statistic.size), 
+                    ('count', statistic.count)
+                ])
+                for statistic in snapshot.statistics('lineno')[:self.top]
+            ])
+        ])
+
+def profile_stage(profiler, stage):
+    """Profiles a stage if there is a profiler
+
+    :param profiler: StageProfiler or None
+    :param stage: Name of the stage
+    :return: Context manager
+    """
+    return profiler.stage(stage) if profiler else contextlib.nullcontext()
+
+def get_function_label(function):
+    """Gets the label of a function of the cProfile statistics
+
+    :param function: (file name, line, function name) tuple
+    :return: Label, i.e. geo2rs.py:123(transform)
+    """
+    file_name, line, name = function
+    if file_name == '~':
+        # Built-in functions
+        return name
+    return "{0}:{1}({2})".format(os.path.basename(file_name), line, name)
+
+def get_collapsed_stacks(stats, min_time=1e-4, max_depth=64):
+    """Converts the cProfile statistics to collapsed stacks (one "frame;frame;frame time" 
+    line per stack), the input format of flamegraph.pl and speedscope. cProfile only 
+    records the callers of each function, not the full stacks, so the own time of each 
+    function is split among its callers in proportion to the time spent in each of them.
+
+    :param stats: stats attribute of a pstats.Stats object
+    :param min_time: The shares of time shorter than this in seconds are dropped, 
+                     which bounds the number of stacks
+    :param max_depth: Maximum number of frames of each stack
+    :return: Dictionary with the own time in microseconds of each stack, from the root
+    """
+    stacks = {}
+
+    def add_stack(stack, own_time):
+        key = ";".join(get_function_label(function) for function in reversed(stack))
+        stacks[key] = stacks.get(key, 0) + own_time
+
+    def reaches_root(function, stack):
+        # True if a chain of callers of the function outside the stack ends in a root
+        visited = set(stack)
+        pending = [function]
+        while pending:
+            current = pending.pop()
+            if current in visited:
+                continue
+            visited.add(current)
+            if not stats[current][4]:
+                return True
+            pending.extend(stats[current][4])
+        return False
+
+    def add_callers(stack, own_time):
+        # The recursive calls, also through other functions, are skipped and the stack 
+        # continues with the other callers up to the root
+        callers = {
+            caller: times for caller, times in stats[stack[-1]][4].items() 
+            if caller not in stack and reaches_root(caller, stack)
+        }
+        total = sum(caller[3] for caller in callers.values())
+        if not callers or total <= 0 or len(stack) >= max_depth:
+            add_stack(stack, own_time)
+            return
+        for caller, (_, _, _, cumulative_time) in callers.items():
+            share = own_time * cumulative_time / total
+            if share >= min_time:
+                add_callers(stack + [caller], share)
+
+    for function, (_, _, own_time, _, _) in stats.items():
+        if own_time >= min_time:
+            add_callers([function], own_time)
+    return OrderedDict(
+        (stack, int(round(own_time * 1000000))) 
+        for stack, own_time in sorted(stacks.items()) if own_time >= 0.0000005
+    )
+
+def print_profile_summary(stages, directory, top=5):
+    """Prints the elapsed time, peak memory and hot spots of each profiled stage
+
+    :param stages: stages attribute of a StageProfiler
+    :param directory: Directory where the profiles were written
+    :param top: Number of functions listed for each stage, by own time
+    """
+    for stage in stages:
+        print("{0}: {1:.2f} s, peak memory {2:.1f} MB".format(
+            stage['stage'], 
+            stage['elapsed'], 
+            stage['peak_memory'] / 1024 / 1024
+        ))
+        for function in stage['functions'][:top]:
+            print("  {0:>9.3f} s {1:>9.3f} s {2:>10} {3}".format(
+                function['time'], 
+                function['cumulative_time'], 
+                function['calls'], 
+                function['function']
+            ))
+        for allocation in stage['allocations'][:3]:
+            print("  {0:>9.1f} MB {1:>8} blocks {2}".format(
+                allocation['size'] / 1024 / 1024, 
+                allocation['count'], 
+                allocation['line']
+            ))
+    print("Profiles written to {0}.".format(directory))
+
+# Extensions of the input files imported from a directory in batch mode
+BATCH_EXTENSIONS = ('.shp', '.gpkg', '.geojson', '.json', '.fgb', '.gml', '.kml', '.tab')
+
+def get_batch_inputs(source, table_name):
+    """Gets the input files and target tables of a batch import
+
+    :param source: Directory, glob pattern or JSON manifest. The manifest maps 
+                   each input file to its table: {"input_file": "table_name", ...}
+    :param table_name: Template of the table names for directories and glob patterns.
+                       {stem} is replaced by the input file name without extension
+    :return: List of (input_file, table_name) tuples
+    """
+    if os.path.isfile(source) and source.endswith('.json'):
+        with open(source) as file:
+            return list(json.load(file).items())
+
+    if os.path.isdir(source):
+        input_files = sorted(
+            os.path.join(source, name) for name in os.listdir(source)
+            if name.lower().endswith(BATCH_EXTENSIONS)
+        )
+    else:
+        input_files = sorted(glob.glob(source))
+
+    if '{stem}' not in table_name:
+        table_name += '_{stem}'
+    inputs = []
+    for input_file in input_files:
+        stem = os.path.splitext(os.path.basename(input_file))[0]
+        stem = re.sub(r'[^0-9a-z_]', '_', stem.lower())
+        inputs.append((input_file, table_name.format(stem=stem)))
+    return inputs
+
+def timed_call(function, *args, **kwargs):
+    """Calls a function measuring its duration
+
+    :return: Tuple with the elapsed seconds and the result of the function
+    """
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+def upload_files_s3(file_name, metadata, bucket, chunk_size=None, max_concurrency=None, 
+                    max_bandwidth=None, checkpoint=None, on_checkpoint=None, on_progress=None):
+    """Uploads the files written by transform() and the manifest of the parts, if any
+
+    :param file_name: Input file
+    :param metadata: Metadata returned by transform()
+    :param bucket: Bucket to upload to
+    :param chunk_size: Size in bytes of each part of the multipart upload
+    :param max_concurrency: Number of threads uploading parts
+    :param max_bandwidth: Maximum bandwidth in bytes per second. Not used with checkpoint
+    :param checkpoint: Dictionary where the state of the upload of each file is recorded,
+                       see upload_file_s3_resumable(). The completed files are skipped
+    :param on_checkpoint: Function called without arguments after checkpoint is updated
+    :param on_progress: Function called with the progress events of each upload
+    :return: S3 path to load with COPY (the file or the manifest of the parts)
+    """
+    uploads = list(metadata['files'])
+    if metadata['parts']:
+        manifest_file = write_manifest(file_name, metadata['files'], bucket)
+        uploads.append(manifest_file)
+        path = "s3://{0}/{1}".format(bucket, manifest_file)
+    else:
+        path = "s3://{0}/{1}".format(bucket, uploads[0])
+    for upload in uploads:
+        if checkpoint is not None:
+            uploaded = upload_file_s3_resumable(upload, bucket, checkpoint.setdefault(upload, {}),
+                                                on_checkpoint, chunk_size, max_concurrency,
+                                                on_progress)
+        else:
+            uploaded = upload_file_s3(upload, bucket, chunk_size, max_concurrency, max_bandwidth,
+                                      on_progress)
+        if not uploaded:
+            raise Exception("Error uploading {0} to S3".format(upload))
+    return path
+
+def import_batch(inputs, bucket, cluster_identifier, database, secret_arn, redshift_role_arn,
+                 transform_concurrency=None, upload_concurrency=4, copy_concurrency=4,
+                 engine="fiona", batch_size=65536, compression=None, output_format="csv",
+                 statement_timeout=None, mode="create", upsert_key=None, spatial_key=None,
+                 table_options=None, sort_memory=None, bbox_columns=False, oversized=None,
+                 precision=None, simplify_tolerance=None, preserve_topology=False,
+                 chunk_size=None, max_concurrency=None, max_bandwidth=None):
+    """Imports many input files as a pipeline: while some files are being transformed, 
+    others are uploaded and loaded. Each stage has its own concurrency limit: 
+    transforms run in a pool of processes, uploads and COPY statements in pools of threads.
+    A failure in one file does not stop the rest.
+
+    :param inputs: List of (input_file, table_name) tuples, see get_batch_inputs()
+    :param bucket: S3 bucket where the files will be uploaded
+    :param cluster_identifier: Redshift cluster
+    :param database: Redshift database where the data will be imported
+    :param secret_arn: ARN of the secret that enables access to the database
+    :param redshift_role_arn: ARN of the Redshift role with read access to S3
+    :param transform_concurrency: Number of files transformed at the same time. 
+                                  By default, the number of CPUs
+    :param upload_concurrency: Number of files uploaded at the same time
+    :param copy_concurrency: Number of COPY statements running at the same time
+    :param engine: Transform engine, "fiona" or "arrow"
+    :param batch_size: Number of features per batch
+    :param compression: Compression of the CSV files
+    :param output_format: "csv" or "parquet"
+    :param statement_timeout: Maximum time in seconds to wait for each statement
+    :param mode: "create", "append" or "upsert", see import_file_redshift()
+    :param upsert_key: Column identifying the rows in upsert mode
+    :param spatial_key: True or extent to add a spatial_key property, see transform()
+    :param table_options: Options of the created tables, see import_file_redshift()
+    :param sort_memory: If set, sorts the features by spatial key, see sort_batches()
+    :param bbox_columns: If True, adds the bounding box properties, see transform()
+    :param oversized: Policy for the oversized geometries, see limit_geometry_size()
+    :param precision: Size of the grid the coordinates are snapped to, see quantize_geometry()
+    :param simplify_tolerance: If set, simplifies the geometries, see transform()
+    :param preserve_topology: If True, the simplification keeps the geometries valid
+    :param chunk_size: Size in bytes of each part of the multipart uploads
+    :param max_concurrency: Number of threads uploading the parts of each file
+    :param max_bandwidth: Maximum bandwidth of each upload in bytes per second
+    :return: List with the result of each input: input_file, table_name, the seconds 
+             spent in each stage, feature_count, simplification (see transform()) 
+             and error (None if it was imported)
+    """
+    jobs = [
+        {'input_file': input_file, 'table_name': table_name, 'transform': None, 
+         'upload': None, 'copy': None, 'feature_count': None, 'simplification': None, 
+         'error': None}
+        for input_file, table_name in inputs
+    ]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=transform_concurrency) as transform_executor, \
+         concurrent.futures.ThreadPoolExecutor(max_workers=upload_concurrency) as upload_executor, \
+         concurrent.futures.ThreadPoolExecutor(max_workers=copy_concurrency) as copy_executor:
+        pending = {}
+        for job in jobs:
+            future = transform_executor.submit(
+                timed_call,
+                transform,
+                job['input_file'],
+                engine,
+                batch_size,
+                compression=compression,
+                output_format=output_format,
+                spatial_key=spatial_key,
+                sort_memory=sort_memory,
+                bbox_columns=bbox_columns,
+                oversized=oversized,
+                precision=precision,
+                simplify_tolerance=simplify_tolerance,
+                preserve_topology=preserve_topology
+            )
+            pending[future] = ('transform', job)
+
+        while pending:
+            done, _ = concurrent.futures.wait(
+                pending, 
+                return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                stage, job = pending.pop(future)
+                try:
+                    job[stage], result = future.result()
+                except Exception as e:
+                    job['error'] = "{0}: {1}".format(stage, e)
+                    logging.error("Error importing %s (%s): %s", job['input_file'], stage, e)
+                    continue
+                if stage == 'transform':
+                    job['metadata'] = result
+                    job['feature_count'] = result['feature_count']
+                    job['simplification'] = result.get('simplification')
+                    future = upload_executor.submit(
+                        timed_call, 
+                        upload_files_s3, 
+                        job['input_file'], 
+                        result, 
+                        bucket,
+                        chunk_size,
+                        max_concurrency,
+                        max_bandwidth
+                    )
+                    pending[future] = ('upload', job)
+                elif stage == 'upload':
+                    future = copy_executor.submit(
+                        timed_call,
+                        import_file_redshift_or_raise,
+                        job['input_file'],
+                        result,
+                        cluster_identifier,
+                        database,
+                        job['table_name'],
+                        secret_arn,
+                        redshift_role_arn,
+                        manifest=job['metadata']['parts'],
+                        compression=compression,
+                        file_format=output_format,
+                        timeout=statement_timeout,
+                        schema=job['metadata']['schema'],
+                        mode=mode,
+                        upsert_key=upsert_key,
+                        table_options=table_options
+                    )
+                    pending[future] = ('copy', job)
+
+    for job in jobs:
+        job.pop('metadata', None)
+    return jobs
+
+def import_file_redshift_or_raise(*args, **kwargs):
+    """Calls import_file_redshift() raising an exception if the import fails"""
+    if not import_file_redshift(*args, **kwargs):
+        raise Exception("Error loading data to Redshift")
+
+def print_batch_report(jobs):
+    """Prints the timings of each file of a batch import and the failures
+
+    :param jobs: List returned by import_batch()
+    """
+    def seconds(value):
+        return "-" if value is None else "{0:.1f}".format(value)
+
+    print("{0:<40} {1:<30} {2:>10} {3:>10} {4:>10} {5:>10}".format(
+        "input_file", "table_name", "features", "transform", "upload", "copy"))
+    for job in jobs:
+        print("{0:<40} {1:<30} {2:>10} {3:>10} {4:>10} {5:>10}".format(
+            job['input_file'],
+            job['table_name'],
+            "-" if job['feature_count'] is None else job['feature_count'],
+            seconds(job['transform']),
+            seconds(job['upload']),
+            seconds(job['copy'])
+        ))
+    for job in jobs:
+        if job['simplification']:
+            print("{0}: {1}".format(job['input_file'], 
+                                    get_simplification_report(job['simplification'])))
+    failures = [job for job in jobs if job['error']]
+    print("{0} files imported, {1} failed.".format(len(jobs) - len(failures), len(failures)))
+    for job in failures:
+        print("{0}: {1}".format(job['input_file'], job['error']))
+
+def get_simplification_report(counts):
+    """Describes the vertices removed by the simplification of a file
+
+    :param counts: Simplification counts of the transform metadata, see transform()
+    :return: Text of the report
+    """
+    return "{0} of {1} vertices removed by the simplification ({2:.1f}%).".format(
+        counts['vertices_removed'],
+        counts['vertices_before'],
+        100.0 * counts['vertices_removed'] / max(counts['vertices_before'], 1)
+    )
+
+def load_checkpoint(checkpoint_file, input_file, options):
+    """Loads the checkpoint of a previous import of the same input file with the same options.
+    A new checkpoint is returned if there is none or the input file or options have changed.
+
+    :param checkpoint_file: JSON file with the checkpoint
+    :param input_file: Input file
+    :param options: Dictionary with the options that change the written or loaded files
+    :return: Checkpoint dictionary with the state of the transform, upload and import stages
+    """
+    stat = os.stat(input_file)
+    source = {'input_file': input_file, 'size': stat.st_size, 'mtime': stat.st_mtime}
+    if os.path.exists(checkpoint_file):
+        with open(checkpoint_file) as file:
+            checkpoint = json.load(file)
+        if checkpoint.get('source') == source and checkpoint.get('options') == options:
+            return checkpoint
+        logging.info("Ignoring checkpoint %s of a different input file or options", checkpoint_file)
+    return {'source': source, 'options': options, 'transform': {}, 'upload': {}, 'import': {}}
+
+def write_checkpoint(checkpoint_file, checkpoint):
+    """Writes a checkpoint replacing the previous one atomically
+
+    :param checkpoint_file: JSON file with the checkpoint
+    :param checkpoint: Checkpoint dictionary, see load_checkpoint()
+    """
+    with open(checkpoint_file + ".tmp", "w") as file:
+        json.dump(checkpoint, file, indent=2)
+    os.replace(checkpoint_file + ".tmp", checkpoint_file)
+
 # Can be used as standalone script or imported as module
-def main(input_file, bucket, cluster_identifier, database, secret_arn, redshift_role_arn, table_name):
+def main(input_file, bucket, cluster_identifier, database, secret_arn, redshift_role_arn, table_name,
+         engine="fiona", batch_size=65536, workers=1, keep_parts=False, 
+         stream=False, stream_part_size=16, stream_max_memory=256, parts=None, compression=None,
+         output_format="csv", statement_timeout=None, chunk_size=None, max_concurrency=None,
+         max_bandwidth=None, max_pool_connections=None, batch=False, transform_concurrency=None,
+         upload_concurrency=4, copy_concurrency=4, mode="create", upsert_key=None,
+         state_file=None, id_field=None, checkpoint_file=None, diststyle=None, distkey=None,
+         sortkey=None, encodings=None, spatial_key=False, spatial_key_extent=None, sort=False,
+         sort_memory=512, bbox_columns=False, oversized=None, profile_types=False, 
+         profile_sample=None, type_headroom=2.0, progress=False, progress_file=None,
+         profile_dir=None, local_backend=None, local_latency=0.0, local_bandwidth=None,
+         local_statement_time=0.0, local_throttle_rate=0.0, local_failure_rate=0.0,
+         precision=None, simplify_tolerance=None, preserve_topology=False):
+
+    if local_backend:
+        # S3 and the Redshift Data API are simulated locally, see geo2rs_local.py
+        from geo2rs_local import LocalBackend
+        backend = LocalBackend(
+            local_backend,
+            local_latency,
+            local_bandwidth and local_bandwidth * 1024 * 1024,
+            local_statement_time,
+            local_throttle_rate,
+            local_failure_rate
+        )
+        configure_backend(backend)
+
+    if max_pool_connections or max_concurrency or batch:
+        # Every upload thread needs its own connection
+        configure_clients(
+            max_pool_connections or 
+            max(10, (max_concurrency or 10) * (upload_concurrency if batch else 1))
+        )
+
+    # The extent must be the same for all the files loaded into the same table
+    spatial_key = spatial_key_extent or spatial_key or sort
+    sort_memory = sort_memory * 1024 * 1024 if sort else None
+    table_options = {
+        'diststyle': diststyle,
+        'distkey': distkey,
+        # Sort the rows by location if there is a spatial key
+        'sortkey': sortkey or (['spatial_key'] if spatial_key else None),
+        'encodings': encodings
+    }
+
+    if stream_part_size * 1024 * 1024 < MIN_PART_SIZE or \
+       (chunk_size is not None and chunk_size * 1024 * 1024 < MIN_PART_SIZE):
+        print("The parts of a multipart upload must be at least 5 MB.")
+        return
+
+    if output_format == "parquet" and compression == "bzip2":
+        print("Parquet files can only be compressed with gzip or zstd.")
+        return
+
+    if batch:
+        # Options of a single import, each file of a batch is imported with its own process
+        single_options = [
+            ("--stream", stream), 
+            ("--workers", workers > 1), 
+            ("--parts", parts), 
+            ("--keep-parts", keep_parts),
+            ("--state-file", state_file), 
+            ("--checkpoint", checkpoint_file), 
+            ("--profile-types", profile_types),
+            ("--progress", progress), 
+            ("--progress-file", progress_file), 
+            ("--profile", profile_dir)
+        ]
+        unsupported = [option for option, value in single_options if value]
+        if unsupported:
+            print("{0} cannot be used in batch mode.".format(", ".join(unsupported)))
+            return
+        # input_file is a directory, glob pattern or manifest and table_name a template
+        jobs = import_batch(
+            get_batch_inputs(input_file, table_name),
+            bucket,
+            cluster_identifier,
+            database,
+            secret_arn,
+            redshift_role_arn,
+            transform_concurrency,
+            upload_concurrency,
+            copy_concurrency,
+            engine,
+            batch_size,
+            compression,
+            output_format,
+            statement_timeout,
+            mode,
+            upsert_key,
+            spatial_key,
+            table_options,
+            sort_memory,
+            bbox_columns,
+            oversized,
+            precision,
+            simplify_tolerance,
+            preserve_topology,
+            chunk_size and chunk_size * 1024 * 1024,
+            max_concurrency,
+            max_bandwidth and max_bandwidth * 1024 * 1024
+        )
+        print_batch_report(jobs)
+        return
 
-    csv_file = transform(input_file)
-    print("CSV file created with geometries in EWKB format.")
+    if stream and output_format != "csv":
+        print("Only CSV files can be streamed to S3.")
+        return
 
-    if upload_file_s3(csv_file, bucket):
-        print("File uploaded to S3.")
+    if state_file and not id_field:
+        print("An id field is required to detect the changes since the previous import.")
+        return
+    if state_file and mode != "upsert" and (mode == "append" or os.path.exists(state_file)):
+        # Appending the changed features would duplicate the updated ones and keep the 
+        # deleted ones, while the state file moves forward
+        print("Only the changes since the previous import are loaded with a state file, "
+              "so they must be merged with --mode upsert. Only the first import, "
+              "without state file yet, can create the table.")
+        return
+    if state_file:
+        # The changed features replace the rows with the same id
+        upsert_key = upsert_key or id_field
+
+    field_types = None
+    feature_count = None
+    if profile_types:
+        # Narrower data types for the table (and the Parquet columns) from the actual values
+        profile = profile_file(input_file, engine, batch_size, profile_sample)
+        field_types = get_profiled_field_types(profile, type_headroom)
+        # The transform does not need to count the features again
+        feature_count = profile['feature_count']
+        print("{0} of {1} features profiled.".format(profile['profiled'], profile['feature_count']))
+        print_storage_savings(get_storage_savings(profile, field_types))
+        table_options['field_types'] = field_types
+
+    on_progress = None
+    if progress or progress_file:
+        on_progress = get_progress_handler(progress, progress_file)
+    profiler = StageProfiler(profile_dir) if profile_dir else None
+
+    checkpoint = None
+    on_checkpoint = None
+    if checkpoint_file:
+        if stream:
+            print("Streamed imports cannot be resumed.")
+            return
+        checkpoint = load_checkpoint(checkpoint_file, input_file, {
+            'bucket': bucket, 'table_name': table_name, 'engine': engine, 'workers': workers,
+            'keep_parts': keep_parts, 'parts': parts, 'compression': compression, 
+            'output_format': output_format, 'mode': mode, 'state_file': state_file,
+            'spatial_key': spatial_key, 'sort': sort, 'bbox_columns': bbox_columns,
+            'oversized': oversized, 'field_types': field_types, 'precision': precision,
+            'simplify_tolerance': simplify_tolerance, 'preserve_topology': preserve_topology
+        })
+        on_checkpoint = lambda: write_checkpoint(checkpoint_file, checkpoint)
+
+    if stream:
+        # The CSV file is uploaded while it is written, using a single transform process
+        csv_file = get_output_file_name(input_file, compression)
+        csv_file_path = "s3://{0}/{1}".format(bucket, csv_file)
+        # The transform and the upload overlap, so they are profiled as a single stage
+        with profile_stage(profiler, "transform"):
+            metadata = transform_to_s3(
+                input_file,
+                bucket,
+                csv_file,
+                engine,
+                batch_size,
+                stream_part_size * 1024 * 1024,
+                stream_max_memory * 1024 * 1024,
+                max_concurrency or 4,
+                compression,
+                state_file,
+                id_field,
+                spatial_key,
+                sort_memory,
+                bbox_columns,
+                oversized,
+                on_progress,
+                precision,
+                simplify_tolerance,
+                preserve_topology,
+                feature_count
+            )
+        uploaded = metadata is not False
+        if uploaded:
+            print("CSV file with geometries in EWKB format streamed to S3.")
+    else:
+        if parts == "auto":
+            # One part per slice so COPY loads them in parallel in every slice
+            parts = get_slice_count(cluster_identifier, database, secret_arn)
+            if parts is False:
+                print("Error getting the number of slices of the cluster, use a number of parts.")
+                return
+            print("Using {0} parts, one per Redshift slice.".format(parts))
+        metadata = checkpoint and checkpoint['transform'].get('metadata')
+        if metadata and all(os.path.exists(file) for file in metadata['files']):
+            print("Resuming the import after the transform.")
+        else:
+            with profile_stage(profiler, "transform"):
+                metadata = transform(input_file, engine, batch_size, workers, keep_parts, 
+                                     parts, compression, output_format, state_file, id_field,
+                                     checkpoint and checkpoint['transform'], on_checkpoint,
+                                     spatial_key, sort_memory, bbox_columns, oversized, 
+                                     field_types, on_progress, precision, 
+                                     simplify_tolerance, preserve_topology, feature_count)
+            if checkpoint:
+                # The new files must be uploaded and loaded again
+                checkpoint['transform']['metadata'] = metadata
+                checkpoint['upload'] = {}
+                checkpoint['import'] = {}
+                on_checkpoint()
+            print("{0} file created with geometries in EWKB format ({1} features).".format(
+                output_format.upper(), 
+                metadata['feature_count']
+            ))
+        try:
+            # COPY loads the parts listed in the manifest if there are several parts
+            with profile_stage(profiler, "upload"):
+                csv_file_path = upload_files_s3(
+                    input_file,
+                    metadata,
+                    bucket, 
+                    chunk_size and chunk_size * 1024 * 1024, 
+                    max_concurrency, 
+                    max_bandwidth and max_bandwidth * 1024 * 1024,
+                    checkpoint and checkpoint['upload'],
+                    on_checkpoint,
+                    on_progress
+                )
+            uploaded = True
+            print("File uploaded to S3.")
+        except Exception as e:
+            logging.error(e)
+            uploaded = False
+
+    if uploaded and simplify_tolerance:
+        print(get_simplification_report(metadata['simplification']))
+
+    if uploaded and precision:
+        print("Coordinates snapped to a grid of {0}: {1} duplicate vertices removed, "
+              "{2:.1f} MB saved.".format(
+                  precision, 
+                  metadata['quantized']['vertices_removed'], 
+                  metadata['quantized']['bytes_saved'] / 1024 / 1024
+              ))
+
+    if uploaded and oversized and any(metadata['oversized'].values()):
+        print("Oversized geometries: {split} split, {simplified} simplified and "
+              "{skipped} skipped.".format(**metadata['oversized']))
+        if metadata['oversized_file']:
+            print("Skipped features written to {0}.".format(metadata['oversized_file']))
+
+    deleted_file_path = None
+    if uploaded and state_file:
+        print("{inserted} features inserted, {updated} updated, {deleted} deleted "
+              "and {unchanged} unchanged since the previous import.".format(**metadata['changes']))
+        if mode == "upsert":
+            if checkpoint:
+                uploaded = upload_file_s3_resumable(
+                    metadata['deleted_file'], 
+                    bucket, 
+                    checkpoint['upload'].setdefault(metadata['deleted_file'], {}), 
+                    on_checkpoint,
+                    on_progress=on_progress
+                )
+            else:
+                uploaded = upload_file_s3(metadata['deleted_file'], bucket, 
+                                          on_progress=on_progress)
+            deleted_file_path = "s3://{0}/{1}".format(bucket, metadata['deleted_file'])
+
+    if uploaded:
         if import_file_redshift(
             input_file,
-            "s3://{0}/{1}".format(bucket, csv_file),
+            csv_file_path,
             cluster_identifier,
             database,
             table_name,
             secret_arn,
-            redshift_role_arn):
+            redshift_role_arn,
+            manifest=metadata['parts'],
+            compression=compression,
+            file_format=output_format,
+            timeout=statement_timeout,
+            schema=metadata['schema'],
+            mode=mode,
+            upsert_key=upsert_key,
+            deleted_file_path=deleted_file_path,
+            checkpoint=checkpoint and checkpoint['import'],
+            on_checkpoint=on_checkpoint,
+            table_options=table_options,
+            on_progress=on_progress,
+            profiler=profiler):
+            if state_file:
+                # The next import is compared with the features that have been loaded
+                commit_feature_hashes(state_file)
+            if checkpoint_file:
+                # A new run imports the file again from the beginning
+                os.remove(checkpoint_file)
             print("Data loaded to Redshift.")
         else:
             print("Error loading data to Redshift.")
     else:
         print("Error uploading file to S3.")
 
+    if profiler:
+        print_profile_summary(profiler.stages, profile_dir)
+    if local_backend:
+        for operation, stats in backend.get_stats().items():
+            print("{0}: {1} requests, {2} throttled, {3} failed.".format(
+                operation, 
+                stats.get('requests', 0), 
+                stats.get('throttled', 0), 
+                stats.get('failed', 0)
+            ))
+
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # Only the messages of the import, not every request of the AWS libraries
+    for library in ("boto3", "botocore", "s3transfer", "urllib3"):
+        logging.getLogger(library).setLevel(logging.WARNING)
     parser = argparse.ArgumentParser()
     parser.add_argument("input_file", help="Input geospatial file. Supported formats: any file format with reading support in Fiona, including Esri Shapefile, GeoPackage, GeoJSON")
     parser.add_argument("bucket", help="S3 bucket where the file will be uploaded.")
@@ -251,8 +3636,62 @@ if __name__ == "__main__":
     parser.add_argument("database", help="Database where the data will be imported.")
     parser.add_argument("secret_arn", help="ARN of the secret that provides access to the database")
     parser.add_argument("redshift_role_arn", help="ARN of the Redshift role with read access to S3")
-    parser.add_argument("table_name", help="Redshift table where the data will be imported. The script will error out if the table already exists.")
+    parser.add_argument("table_name", help="Redshift table where the data will be imported. The script will error out if the table already exists, unless --mode is append or upsert.")
+    parser.add_argument("--engine", choices=["fiona", "arrow"], default="fiona", help="Transform engine. The arrow engine reads the features in batches with pyogrio and requires Shapely 2.")
+    parser.add_argument("--batch-size", type=int, default=65536, help="Number of features per batch with the arrow engine.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes used to transform the input file.")
+    parser.add_argument("--keep-parts", action="store_true", help="Upload the CSV part written by each process as a separate object instead of concatenating them.")
+    parser.add_argument("--stream", action="store_true", help="Stream the CSV file to S3 with a multipart upload while it is written, without writing it to disk. Uses a single transform process.")
+    parser.add_argument("--stream-part-size", type=int, default=16, help="Size in MB of each part of the streamed upload, at least 5.")
+    parser.add_argument("--stream-max-memory", type=int, default=256, help="Maximum memory in MB used for buffering the streamed upload.")
+    parser.add_argument("--parts", help="Number of CSV parts loaded in parallel by COPY through a manifest, or 'auto' to use the number of slices of the cluster.")
+    parser.add_argument("--compression", choices=["gzip", "zstd", "bzip2"], help="Compress the CSV files while they are written. zstd requires the zstandard package. With --format parquet, codec of the Parquet columns: only gzip or zstd.")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="Format of the files loaded with COPY. Parquet requires pyarrow.")
+    parser.add_argument("--statement-timeout", type=float, help="Maximum time in seconds to wait for each Redshift statement. The statement is cancelled if exceeded.")
+    parser.add_argument("--chunk-size", type=int, help="Size in MB of each part of the multipart upload to S3, at least 5.")
+    parser.add_argument("--max-concurrency", type=int, help="Number of threads uploading parts to S3.")
+    parser.add_argument("--max-bandwidth", type=int, help="Maximum upload bandwidth in MB/s.")
+    parser.add_argument("--max-pool-connections", type=int, help="Maximum number of connections kept open by each AWS client. By default, 10 or the upload concurrency if it is higher.")
+    parser.add_argument("--batch", action="store_true", help="Import many files: input_file is a directory, a glob pattern or a JSON manifest mapping input files to tables, and table_name a template where {stem} is replaced by each input file name.")
+    parser.add_argument("--transform-concurrency", type=int, help="Number of files transformed at the same time in batch mode. By default, the number of CPUs.")
+    parser.add_argument("--upload-concurrency", type=int, default=4, help="Number of files uploaded at the same time in batch mode.")
+    parser.add_argument("--copy-concurrency", type=int, default=4, help="Number of COPY statements running at the same time in batch mode.")
+    parser.add_argument("--mode", choices=["create", "append", "upsert"], default="create", help="create: creates the table. append: inserts the rows into an existing table. upsert: replaces the rows of an existing table with the same --upsert-key and inserts the rest.")
+    parser.add_argument("--upsert-key", help="Column identifying the rows in upsert mode.")
+    parser.add_argument("--state-file", help="CSV file with the hash of each feature of the previous import. Only the features inserted or updated since then are loaded and the deleted ones are removed, so it requires --mode upsert once the file exists (the first import can create the table). It is updated after a successful load.")
+    parser.add_argument("--id-field", help="Property identifying the features when using --state-file. By default, also the upsert key.")
+    parser.add_argument("--profile-types", action="store_true", help="Scan the property values before the transform and create the table with the narrowest data types that hold them (SMALLINT, INTEGER, REAL, VARCHAR(n)), printing the estimated storage savings.")
+    parser.add_argument("--profile-sample", type=int, help="Number of features scanned by --profile-types, read from ranges spread across the file. By default, all the features are scanned.")
+    parser.add_argument("--type-headroom", type=float, default=2.0, help="Factor applied to the largest number and the longest string found by --profile-types before choosing the data type, so future appends do not overflow (default 2).")
+    parser.add_argument("--progress", action="store_true", help="Show the progress of the transform (features/s, MB written, ETA), the uploads (MB/s) and COPY (elapsed time, rows loaded) on standard error.")
+    parser.add_argument("--progress-file", help="Append the progress events of each stage to this file as JSON lines, i.e. to ship them to a metrics system.")
+    parser.add_argument("--profile", help="Profile the transform, upload, DDL and COPY stages separately and write their CPU profiles (pstats and collapsed stacks for flame graphs) and memory snapshots (tracemalloc) to this directory. The hot spots of each stage are listed at the end. The processes of a parallel transform are not profiled.")
+    parser.add_argument("--local-backend", help="Import without AWS: S3 objects are stored in this directory and the statements are executed against a local SQLite database, see geo2rs_local.py. The bucket, cluster, secret and role arguments are only used as names.")
+    parser.add_argument("--local-latency", type=float, default=0.0, help="Seconds added to every request of the local backend.")
+    parser.add_argument("--local-bandwidth", type=float, help="MB per second of each connection to the local S3. By default, unlimited.")
+    parser.add_argument("--local-statement-time", type=float, default=0.0, help="Seconds each statement runs in the local backend before it finishes.")
+    parser.add_argument("--local-throttle-rate", type=float, default=0.0, help="Probability of a request to the local backend being throttled. Throttled requests are retried with backoff, like botocore does.")
+    parser.add_argument("--local-failure-rate", type=float, default=0.0, help="Probability of a request to the local S3 or a statement of the local backend failing.")
+    parser.add_argument("--checkpoint", help="JSON file recording the completed stages of the import (transform parts, uploaded parts with their ETags, table created, COPY). If the import fails, running it again with the same checkpoint resumes it from the first incomplete stage.")
+    parser.add_argument("--diststyle", choices=["auto", "even", "key", "all"], help="Distribution style of the created table.")
+    parser.add_argument("--distkey", help="Distribution key column of the created table.")
+    parser.add_argument("--sortkey", help="Comma-separated list of the sort key columns of the created table. By default, spatial_key if --spatial-key is used.")
+    parser.add_argument("--encode", help="Comma-separated list of column=encoding pairs with the compression encoding of the columns of the created table, i.e. name=zstd,n=az64.")
+    parser.add_argument("--spatial-key", action="store_true", help="Add a spatial_key column with the Hilbert index of the center of the bounding box of each geometry, used as sort key so the zone maps skip the blocks outside a bounding box.")
+    parser.add_argument("--spatial-key-extent", help="Extent minx,miny,maxx,maxy of the grid of the spatial key. By default, the extent of the input file. Use the same extent for all the files loaded into the same table. Implies --spatial-key.")
+    parser.add_argument("--sort", action="store_true", help="Write the features sorted by their spatial key with an external sort in bounded memory, so each block of the table covers a compact area. Implies --spatial-key and uses a single transform process.")
+    parser.add_argument("--sort-memory", type=int, default=512, help="Approximate memory in MB used for each sorted run with --sort. The features that do not fit are sorted in several runs written to temporary files and merged.")
+    parser.add_argument("--bbox-columns", action="store_true", help="Add minx, miny, maxx and maxy DOUBLE PRECISION columns with the bounding box of each geometry, for cheap envelope pre-filters.")
+    parser.add_argument("--simplify", type=float, help="Simplify the geometries with this tolerance in units of the CRS before encoding them, printing the vertices removed from each file. Unless --preserve-topology is used, the simplified geometries may be invalid and small polygons collapse.")
+    parser.add_argument("--preserve-topology", action="store_true", help="Simplify the geometries with --simplify keeping them valid, i.e. without self-intersections or collapsed rings. Slower.")
+    parser.add_argument("--precision", type=float, help="Snap the coordinates to a grid of this size in units of the CRS (i.e. 1e-7 degrees or 0.01 metres) and remove the consecutive duplicate vertices created by the snapping, printing the bytes saved.")
+    parser.add_argument("--oversized", choices=["split", "simplify", "file"], help="What to do with the geometries larger than the maximum size of a Redshift GEOMETRY: split them with a grid in several features, simplify them or write them to a GeoJSON sequence file instead of loading them. By default, they are written as they are and COPY fails.")
     args = parser.parse_args()
+    # Every part of a multipart upload but the last one must be at least 5 MB
+    if args.stream_part_size < 5:
+        parser.error("--stream-part-size must be at least 5 MB.")
+    if args.chunk_size is not None and args.chunk_size < 5:
+        parser.error("--chunk-size must be at least 5 MB.")
 
     main(
         args.input_file, 
@@ -261,5 +3700,54 @@ if __name__ == "__main__":
         args.database,
         args.secret_arn,
         args.redshift_role_arn,
-        args.table_name 
+        args.table_name,
+        args.engine,
+        args.batch_size,
+        args.workers,
+        args.keep_parts,
+        args.stream,
+        args.stream_part_size,
+        args.stream_max_memory,
+        args.parts if args.parts in (None, "auto") else int(args.parts),
+        args.compression,
+        args.format,
+        args.statement_timeout,
+        args.chunk_size,
+        args.max_concurrency,
+        args.max_bandwidth,
+        args.max_pool_connections,
+        args.batch,
+        args.transform_concurrency,
+        args.upload_concurrency,
+        args.copy_concurrency,
+        args.mode,
+        args.upsert_key,
+        args.state_file,
+        args.id_field,
+        args.checkpoint,
+        args.diststyle,
+        args.distkey,
+        args.sortkey and args.sortkey.split(","),
+        args.encode and dict(pair.split("=", 1) for pair in args.encode.split(",")),
+        args.spatial_key,
+        args.spatial_key_extent and [float(value) for value in args.spatial_key_extent.split(",")],
+        args.sort,
+        args.sort_memory,
+        args.bbox_columns,
+        args.oversized,
+        args.profile_types,
+        args.profile_sample,
+        args.type_headroom,
+        args.progress,
+        args.progress_file,
+        args.profile,
+        args.local_backend,
+        args.local_latency,
+        args.local_bandwidth,
+        args.local_statement_time,
+        args.local_throttle_rate,
+        args.local_failure_rate,
+        args.precision,
+        args.simplify,
+        args.preserve_topology
     )
\ No newline at end of file
@@ -0,0 +1,313 @@
+import argparse
+import json
+import os
+import time
+from collections import OrderedDict
+
+import fiona
+
+import geo2rs
+
+def run_import(input_file, bucket, cluster_identifier, database, secret_arn, redshift_role_arn,
+               table_name, engine="fiona", workers=1, compression=None, output_format="csv"):
+    """Imports a file into Redshift measuring the time spent in each stage
+
+    :param input_file: Input geospatial file
+    :param bucket: S3 bucket where the files will be uploaded
+    :param cluster_identifier: Redshift cluster
+    :param database: Redshift database where the data will be imported
+    :param secret_arn: ARN of the secret that enables access to the database
+    :param redshift_role_arn: ARN of the Redshift role with read access to S3
+    :param table_name: Redshift table where the data will be imported
+    :param engine: Transform engine, "fiona" or "arrow"
+    :param workers: Number of transform processes
+    :param compression: Compression of the CSV files
+    :param output_format: "csv" or "parquet"
+    :return: Dictionary with the timings in seconds and the size of the uploaded files
+    """
+    result = OrderedDict()
+    result['format'] = output_format
+    result['table_name'] = table_name
+
+    start = time.perf_counter()
+    metadata = geo2rs.transform(
+        input_file,
+        engine,
+        workers=workers,
+        keep_parts=workers > 1,
+        compression=compression if output_format == "csv" else None,
+        output_format=output_format
+    )
+    result['transform'] = time.perf_counter() - start
+
+    files = metadata['files']
+    result['features'] = metadata['feature_count']
+    result['bytes'] = sum(os.path.getsize(file) for file in files)
+    manifest = metadata['parts']
+    if manifest:
+        manifest_file = geo2rs.write_manifest(input_file, files, bucket)
+        path = "s3://{0}/{1}".format(bucket, manifest_file)
+        files = files + [manifest_file]
+    else:
+        path = "s3://{0}/{1}".format(bucket, files[0])
+
+    start = time.perf_counter()
+    if not all(geo2rs.upload_file_s3(file, bucket) for file in files):
+        raise Exception("Error uploading {0} files to S3".format(output_format))
+    result['upload'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if not geo2rs.import_file_redshift(
+        input_file,
+        path,
+        cluster_identifier,
+        database,
+        table_name,
+        secret_arn,
+        redshift_role_arn,
+        manifest=manifest,
+        compression=compression if output_format == "csv" else None,
+        file_format=output_format,
+        schema=metadata['schema']):
+        raise Exception("Error loading {0} files to Redshift".format(output_format))
+    result['load'] = time.perf_counter() - start
+
+    result['total'] = result['transform'] + result['upload'] + result['load']
+    return result
+
+def benchmark_formats(input_file, bucket, cluster_identifier, database, secret_arn,
+                      redshift_role_arn, table_prefix, engine="fiona", workers=1,
+                      compression=None, formats=("csv", "parquet"), drop_tables=True):
+    """Compares the end-to-end load time of the CSV and Parquet staging formats.
+    Each format is loaded into its own table named <table_prefix>_<format>.
+
+    :param input_file: Input geospatial file
+    :param bucket: S3 bucket where the files will be uploaded
+    :param cluster_identifier: Redshift cluster
+    :param database: Redshift database where the data will be imported
+    :param secret_arn: ARN of the secret that enables access to the database
+    :param redshift_role_arn: ARN of the Redshift role with read access to S3
+    :param table_prefix: Prefix of the tables created by the benchmark
+    :param engine: Transform engine, "fiona" or "arrow"
+    :param workers: Number of transform processes
+    :param compression: Compression of the CSV files
+    :param formats: Staging formats to compare
+    :param drop_tables: If True, the tables are dropped after the benchmark
+    :return: List with the results of each format
+    """
+    results = []
+    for output_format in formats:
+        table_name = "{0}_{1}".format(table_prefix, output_format)
+        try:
+            results.append(run_import(
+                input_file,
+                bucket,
+                cluster_identifier,
+                database,
+                secret_arn,
+                redshift_role_arn,
+                table_name,
+                engine,
+                workers,
+                compression,
+                output_format
+            ))
+        finally:
+            if drop_tables:
+                geo2rs.execute_redshift_statement(
+                    cluster_identifier,
+                    database,
+                    secret_arn,
+                    "DROP TABLE IF EXISTS {0};".format(table_name)
+                )
+    return results
+
+def benchmark_spatial_sort(input_file, bucket, cluster_identifier, database, secret_arn,
+                           redshift_role_arn, table_prefix, bbox, engine="fiona", 
+                           sort_memory=512, drop_tables=True):
+    """Compares the blocks skipped by a bounding box query on a table loaded in the order
+    of the input file and on a table loaded sorted by spatial key. Both tables are created 
+    without sort key, so the rows are stored in the order they are written by transform().
+    Each table is named <table_prefix>_<order>.
+
+    :param input_file: Input geospatial file
+    :param bucket: S3 bucket where the files will be uploaded
+    :param cluster_identifier: Redshift cluster
+    :param database: Redshift database where the data will be imported
+    :param secret_arn: ARN of the secret that enables access to the database
+    :param redshift_role_arn: ARN of the Redshift role with read access to S3
+    :param table_prefix: Prefix of the tables created by the benchmark
+    :param bbox: (minx, miny, maxx, maxy) bounding box of the query
+    :param engine: Transform engine, "fiona" or "arrow"
+    :param sort_memory: Memory in MB used for each sorted run
+    :param drop_tables: If True, the tables are dropped after the benchmark
+    :return: List with the results of each order
+    """
+    with fiona.open(input_file, "r") as source:
+        extent = source.bounds
+    condition = geo2rs.get_spatial_key_condition(bbox, extent)
+
+    results = []
+    for order, order_sort_memory in (("source", None), ("spatial", sort_memory * 1024 * 1024)):
+        table_name = "{0}_{1}".format(table_prefix, order)
+        try:
+            start = time.perf_counter()
+            metadata = geo2rs.transform(
+                input_file, 
+                engine, 
+                spatial_key=extent, 
+                sort_memory=order_sort_memory
+            )
+            transform_time = time.perf_counter() - start
+            path = geo2rs.upload_files_s3(input_file, metadata, bucket)
+            if not geo2rs.import_file_redshift(
+                input_file,
+                path,
+                cluster_identifier,
+                database,
+                table_name,
+                secret_arn,
+                redshift_role_arn,
+                schema=metadata['schema']):
+                raise Exception("Error loading {0} to Redshift".format(table_name))
+            result = run_bbox_query(cluster_identifier, database, secret_arn, table_name, condition)
+            result['order'] = order
+            result['features'] = metadata['feature_count']
+            result['transform'] = transform_time
+            results.append(result)
+        finally:
+            if drop_tables:
+                geo2rs.execute_redshift_statement(
+                    cluster_identifier,
+                    database,
+                    secret_arn,
+                    "DROP TABLE IF EXISTS {0};".format(table_name)
+                )
+    return results
+
+def run_bbox_query(cluster_identifier, database, secret_arn, table_name, condition):
+    """Runs a query filtered by spatial key and gets the rows read by its scan from STL_SCAN.
+    The rows of the blocks skipped thanks to the zone maps are not read.
+
+    :param cluster_identifier: Redshift cluster
+    :param database: Redshift database
+    :param secret_arn: ARN of the secret that enables access to the database
+    :param table_name: Table to query
+    :param condition: SQL condition on the spatial_key column
+    :return: Dictionary with the matched rows, the scanned rows and the query time
+    """
+    # Unique comment to find the query in STL_QUERY and avoid the result cache
+    tag = "geo2rs-benchmark-{0}".format(time.time_ns())
+    start = time.perf_counter()
+    records = geo2rs.execute_redshift_statement(
+        cluster_identifier,
+        database,
+        secret_arn,
+        "/* {0} */ SELECT COUNT(*) FROM {1} WHERE {2};".format(tag, table_name, condition)
+    )
+    query_time = time.perf_counter() - start
+    scan = geo2rs.execute_redshift_statement(
+        cluster_identifier,
+        database,
+        secret_arn,
+        ("SELECT SUM(rows_pre_filter) FROM stl_scan "
+         "WHERE TRIM(perm_table_name) = '{0}' AND query = "
+         "(SELECT MAX(query) FROM stl_query WHERE querytxt LIKE '/* {1} */%');").format(
+             table_name.split('.')[-1], 
+             tag
+         )
+    )
+    if records is False or scan is False:
+        raise Exception("Error querying {0}".format(table_name))
+    return OrderedDict([
+        ('table_name', table_name),
+        ('matched', records[0][0]['longValue']),
+        ('scanned', scan[0][0].get('longValue', 0)),
+        ('query', query_time)
+    ])
+
+def print_spatial_sort_results(results):
+    """Prints the spatial sort benchmark results as a table
+
+    :param results: List of results
+    """
+    print("{0:<10}{1:>12}{2:>12}{3:>12}{4:>10}{5:>12}".format(
+        "order", "features", "matched", "scanned", "% read", "query"))
+    for result in results:
+        print("{0:<10}{1:>12}{2:>12}{3:>12}{4:>10.1f}{5:>12.2f}".format(
+            result['order'],
+            result['features'],
+            result['matched'],
+            result['scanned'],
+            100.0 * result['scanned'] / max(result['features'], 1),
+            result['query']
+        ))
+
+def print_results(results):
+    """Prints the benchmark results as a table
+
+    :param results: List of results
+    """
+    print("{0:<10}{1:>14}{2:>12}{3:>12}{4:>12}{5:>12}".format(
+        "format", "MB", "transform", "upload", "load", "total"))
+    for result in results:
+        print("{0:<10}{1:>14.1f}{2:>12.2f}{3:>12.2f}{4:>12.2f}{5:>12.2f}".format(
+            result['format'],
+            result['bytes'] / 1024 / 1024,
+            result['transform'],
+            result['upload'],
+            result['load'],
+            result['total']
+        ))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the Redshift importer (geo2rs.py)")
+    parser.add_argument("input_file", help="Input geospatial file.")
+    parser.add_argument("bucket", help="S3 bucket where the files will be uploaded.")
+    parser.add_argument("cluster_identifier", help="Redshift cluster identifier")
+    parser.add_argument("database", help="Database where the data will be imported.")
+    parser.add_argument("secret_arn", help="ARN of the secret that provides access to the database")
+    parser.add_argument("redshift_role_arn", help="ARN of the Redshift role with read access to S3")
+    parser.add_argument("table_prefix", help="Prefix of the tables created by the benchmark.")
+    parser.add_argument("--engine", choices=["fiona", "arrow"], default="fiona", help="Transform engine.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of transform processes.")
+    parser.add_argument("--compression", choices=["gzip", "zstd", "bzip2"], help="Compression of the CSV files.")
+    parser.add_argument("--keep-tables", action="store_true", help="Do not drop the tables after the benchmark.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--spatial-sort-bbox", help="Instead of comparing the staging formats, compare the rows scanned by a query with this bounding box (minx,miny,maxx,maxy) on a table loaded in the input file order and on a table loaded sorted by spatial key.")
+    parser.add_argument("--sort-memory", type=int, default=512, help="Memory in MB used for each sorted run in the spatial sort benchmark.")
+    args = parser.parse_args()
+
+    if args.spatial_sort_bbox:
+        results = benchmark_spatial_sort(
+            args.input_file,
+            args.bucket,
+            args.cluster_identifier,
+            args.database,
+            args.secret_arn,
+            args.redshift_role_arn,
+            args.table_prefix,
+            [float(value) for value in args.spatial_sort_bbox.split(",")],
+            args.engine,
+            args.sort_memory,
+            drop_tables=not args.keep_tables
+        )
+        print_spatial_sort_results(results)
+    else:
+        results = benchmark_formats(
+            args.input_file,
+            args.bucket,
+            args.cluster_identifier,
+            args.database,
+            args.secret_arn,
+            args.redshift_role_arn,
+            args.table_prefix,
+            args.engine,
+            args.workers,
+            args.compression,
+            drop_tables=not args.keep_tables
+        )
+        print_results(results)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
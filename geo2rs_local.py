@@ -0,0 +1,648 @@
+import bz2
+import concurrent.futures
+import csv
+import datetime
+import gzip
+import itertools
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+
+from botocore.exceptions import ClientError
+
+# Error codes of the simulated throttling of each service
+THROTTLING_CODES = {
+    's3': 'SlowDown',
+    'redshift-data': 'ThrottlingException'
+}
+
+# Number of records of each page of get_statement_result()
+RESULT_PAGE_SIZE = 1000
+
+class LocalBackend:
+    """Offline stand-in for the AWS services used by geo2rs, selected with
+    geo2rs.configure_backend(). S3 objects are stored in a local directory and the
+    Redshift Data API statements are executed against a SQLite database, so the whole
+    import (uploads, polling, pagination, retries and concurrency) runs without AWS.
+    Latency, bandwidth, statement time, throttling and failures can be injected to
+    benchmark the orchestration.
+    """
+
+    def __init__(self, directory, latency=0.0, bandwidth=None, statement_time=0.0,
+                 throttle_rate=0.0, failure_rate=0.0, max_attempts=3, slices=4, seed=None):
+        """
+        :param directory: Directory with the S3 objects (<directory>/s3/<bucket>/<key>)
+                          and the SQLite databases
+        :param latency: Seconds added to every request
+        :param bandwidth: Bytes per second of each S3 connection. By default, unlimited
+        :param statement_time: Seconds each SQL statement runs before it finishes
+        :param throttle_rate: Probability of a request being throttled. Like botocore,
+                              the clients retry the throttled requests with exponential
+                              backoff, and the error is raised after max_attempts
+        :param failure_rate: Probability of an S3 request failing with InternalError,
+                             and of a SQL statement failing
+        :param max_attempts: Attempts of each throttled request, including the first one
+        :param slices: Number of slices returned by the stv_slices query
+        :param seed: Seed of the random generator of the injected throttling and failures
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.statement_time = statement_time
+        self.throttle_rate = throttle_rate
+        self.failure_rate = failure_rate
+        self.max_attempts = max_attempts
+        self.slices = slices
+        # Requests, throttled requests and failures of each service and operation
+        self.stats = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._clients = {}
+
+    def client(self, service_name):
+        """Gets the client of a service, shared by all the threads like a boto3 client
+
+        :param service_name: "s3" or "redshift-data"
+        :return: LocalS3Client or LocalRedshiftDataClient
+        """
+        with self._lock:
+            if service_name not in self._clients:
+                if service_name == 's3':
+                    self._clients[service_name] = LocalS3Client(self)
+                elif service_name == 'redshift-data':
+                    self._clients[service_name] = LocalRedshiftDataClient(self)
+                else:
+                    raise ValueError("Service not supported by the local backend: " + service_name)
+            return self._clients[service_name]
+
+    def request(self, service_name, operation_name, can_fail=True):
+        """Simulates the latency, throttling and failures of a request
+
+        :param service_name: "s3" or "redshift-data"
+        :param operation_name: Name of the API operation
+        :param can_fail: If False, failures are not injected
+        :return: True if a failure must be injected in the result of the request
+        """
+        for attempt in range(self.max_attempts):
+            if self.latency:
+                time.sleep(self.latency)
+            with self._lock:
+                self.stats[(service_name, operation_name, 'requests')] += 1
+                throttled = self._random.random() < self.throttle_rate
+                failed = can_fail and self._random.random() < self.failure_rate
+                if throttled:
+                    self.stats[(service_name, operation_name, 'throttled')] += 1
+                elif failed:
+                    self.stats[(service_name, operation_name, 'failed')] += 1
+            if not throttled:
+                return failed
+            if attempt < self.max_attempts - 1:
+                # Full jitter exponential backoff, as botocore does
+                time.sleep(random.uniform(0, min(20.0, 0.05 * 2 ** attempt)))
+        raise ClientError(
+            {'Error': {'Code': THROTTLING_CODES[service_name], 'Message': 'Rate exceeded'}},
+            operation_name
+        )
+
+    def get_stats(self):
+        """Gets the request statistics
+
+        :return: Dictionary with the requests, throttled and failed counts of each
+                 service and operation, i.e. {"s3.upload_part": {"requests": 10, ...}}
+        """
+        stats = {}
+        with self._lock:
+            for (service_name, operation_name, name), count in sorted(self.stats.items()):
+                stats.setdefault(service_name + "." + operation_name, {})[name] = count
+        return stats
+
+class LocalS3Client:
+    """Stand-in for the boto3 S3 client. Only the calls made by geo2rs are implemented.
+    The parts of the multipart uploads are stored in <directory>/s3/.uploads until the 
+    upload is completed, so they can be resumed by another process as in S3.
+    """
+
+    def __init__(self, backend):
+        """
+        :param backend: LocalBackend
+        """
+        self.backend = backend
+        self.root = os.path.join(backend.directory, "s3")
+        self.uploads_directory = os.path.join(self.root, ".uploads")
+
+    def get_path(self, bucket, key):
+        """Gets the local path of an object
+
+        :param bucket: Bucket of the object
+        :param key: Key of the object
+        :return: Path of the file
+        """
+        return os.path.join(self.root, bucket, key.lstrip('/'))
+
+    def get_url_path(self, url):
+        """Gets the local path of an s3://bucket/key URL
+
+        :param url: S3 URL
+        :return: Path of the file
+        """
+        bucket, key = url[len("s3://"):].split('/', 1)
+        return self.get_path(bucket, key)
+
+    def transfer(self, data_size, limit=None):
+        """Simulates the time of sending data through one connection
+
+        :param data_size: Bytes sent
+        :param limit: LocalBandwidthLimit shared by the connections of the same transfer
+        """
+        now = time.monotonic()
+        finish = now + (data_size / self.backend.bandwidth if self.backend.bandwidth else 0.0)
+        if limit:
+            finish = max(finish, limit.reserve(data_size))
+        if finish > now:
+            time.sleep(finish - now)
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        # Like boto3, large files are uploaded in parts by several threads
+        size = os.path.getsize(Filename)
+        chunk_size = Config.multipart_chunksize if Config else 8 * 1024 * 1024
+        threshold = Config.multipart_threshold if Config else 8 * 1024 * 1024
+        # Like boto3, max_bandwidth is shared by all the threads of the transfer
+        limit = None
+        if Config and Config.max_bandwidth:
+            limit = LocalBandwidthLimit(Config.max_bandwidth)
+        if size < threshold:
+            with open(Filename, "rb") as file:
+                body = file.read()
+            self._put_object(Bucket, Key, body, limit)
+            if Callback:
+                Callback(len(body))
+            return
+
+        upload_id = self.create_multipart_upload(Bucket=Bucket, Key=Key)['UploadId']
+
+        def upload_part(part_number):
+            with open(Filename, "rb") as file:
+                file.seek((part_number - 1) * chunk_size)
+                body = file.read(chunk_size)
+            etag = self._upload_part(upload_id, part_number, body, limit)['ETag']
+            if Callback:
+                Callback(len(body))
+            return {'PartNumber': part_number, 'ETag': etag}
+
+        part_count = (size + chunk_size - 1) // chunk_size
+        max_concurrency = Config.max_concurrency if Config else 10
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+                parts = list(executor.map(upload_part, range(1, part_count + 1)))
+        except ClientError:
+            self.abort_multipart_upload(Bucket=Bucket, Key=Key, UploadId=upload_id)
+            raise
+        self.complete_multipart_upload(Bucket=Bucket, Key=Key, UploadId=upload_id,
+                                       MultipartUpload={'Parts': parts})
+
+    def put_object(self, Bucket, Key, Body):
+        return self._put_object(Bucket, Key, Body)
+
+    def create_multipart_upload(self, Bucket, Key):
+        self._request('create_multipart_upload')
+        upload_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.uploads_directory, upload_id))
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        return self._upload_part(UploadId, PartNumber, Body)
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self._request('complete_multipart_upload')
+
+        def read_parts():
+            for part in MultipartUpload['Parts']:
+                part_file = self.get_part_path(UploadId, part['PartNumber'], 'CompleteMultipartUpload')
+                with open(part_file, "rb") as file:
+                    yield file.read()
+
+        self.write_object(Bucket, Key, read_parts())
+        shutil.rmtree(os.path.join(self.uploads_directory, UploadId), ignore_errors=True)
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._request('abort_multipart_upload', can_fail=False)
+        shutil.rmtree(os.path.join(self.uploads_directory, UploadId), ignore_errors=True)
+        return {}
+
+    def get_part_path(self, upload_id, part_number, operation_name):
+        """Gets the path of a part of a multipart upload
+
+        :param upload_id: Id of the upload
+        :param part_number: Number of the part
+        :param operation_name: Operation, used in the error if the upload does not exist
+        :return: Path of the part file
+        """
+        directory = os.path.join(self.uploads_directory, upload_id)
+        if not os.path.isdir(directory):
+            raise ClientError({'Error': {'Code': 'NoSuchUpload'}}, operation_name)
+        return os.path.join(directory, str(part_number))
+
+    def get_paginator(self, operation_name):
+        return LocalListPartsPaginator(self)
+
+    def write_object(self, bucket, key, chunks):
+        """Stores an object, replacing it atomically if it exists
+
+        :param bucket: Bucket of the object
+        :param key: Key of the object
+        :param chunks: Iterable of bytes with the content
+        """
+        path = self.get_path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".uploading", "wb") as file:
+            for chunk in chunks:
+                file.write(chunk)
+        os.replace(path + ".uploading", path)
+
+    def _put_object(self, bucket, key, body, limit=None):
+        self._request('put_object')
+        self.transfer(len(body), limit)
+        self.write_object(bucket, key, [body])
+        return {}
+
+    def _upload_part(self, upload_id, part_number, body, limit=None):
+        self._request('upload_part')
+        data = body.read() if hasattr(body, 'read') else bytes(body)
+        self.transfer(len(data), limit)
+        part_file = self.get_part_path(upload_id, part_number, 'UploadPart')
+        with open(part_file + ".uploading", "wb") as file:
+            file.write(data)
+        os.replace(part_file + ".uploading", part_file)
+        return {'ETag': '"{0}-{1}"'.format(upload_id, part_number)}
+
+    def _request(self, operation_name, can_fail=True):
+        if self.backend.request('s3', operation_name, can_fail):
+            raise ClientError(
+                {'Error': {'Code': 'InternalError', 'Message': 'Injected failure'}},
+                operation_name
+            )
+
+class LocalBandwidthLimit:
+    """Bandwidth shared by the connections of a transfer, like the max_bandwidth 
+    of the boto3 TransferConfig
+    """
+
+    def __init__(self, bandwidth):
+        """
+        :param bandwidth: Bytes per second
+        """
+        self.bandwidth = bandwidth
+        self.available = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, data_size):
+        """Reserves the time to send some data after the data already reserved
+
+        :param data_size: Bytes sent
+        :return: time.monotonic() value when the data has been sent
+        """
+        with self.lock:
+            self.available = max(self.available, time.monotonic()) + data_size / self.bandwidth
+            return self.available
+
+class LocalListPartsPaginator:
+    """Stand-in for the list_parts paginator of the S3 client"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def paginate(self, Bucket, Key, UploadId):
+        self.client._request('list_parts', can_fail=False)
+        directory = os.path.dirname(self.client.get_part_path(UploadId, 1, 'ListParts'))
+        numbers = sorted(int(name) for name in os.listdir(directory) if name.isdigit())
+        yield {
+            'Parts': [
+                {'PartNumber': number, 'ETag': '"{0}-{1}"'.format(UploadId, number)}
+                for number in numbers
+            ]
+        }
+
+class LocalRedshiftDataClient:
+    """Stand-in for the boto3 Redshift Data API client. The statements are submitted
+    and run in background threads against a SQLite database, translating the Redshift
+    statements written by geo2rs (table attributes, COPY, CREATE TEMP TABLE ... LIKE
+    and DELETE ... USING). Schema-qualified tables are stored in their own database file.
+    GEOMETRY columns store the EWKB as loaded.
+    """
+
+    def __init__(self, backend):
+        """
+        :param backend: LocalBackend
+        """
+        self.backend = backend
+        # Rows loaded by the last COPY
+        self.loaded_rows = None
+        self._statements = {}
+        self._statement_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._database_lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            os.path.join(backend.directory, "redshift.sqlite"),
+            isolation_level=None,
+            check_same_thread=False
+        )
+        self._schemas = set()
+
+    def execute_statement(self, Sql, **kwargs):
+        return self._submit([Sql], 'execute_statement')
+
+    def batch_execute_statement(self, Sqls, **kwargs):
+        return self._submit(Sqls, 'batch_execute_statement')
+
+    def describe_statement(self, Id):
+        self.backend.request('redshift-data', 'describe_statement', can_fail=False)
+        with self._lock:
+            statement = self._statements[Id]
+            response = {key: value for key, value in statement.items() if key != 'Records'}
+            if 'SubStatements' in response:
+                response['SubStatements'] = [dict(sub) for sub in response['SubStatements']]
+        return response
+
+    def get_statement_result(self, Id, NextToken=None):
+        self.backend.request('redshift-data', 'get_statement_result', can_fail=False)
+        records = self._statements[Id]['Records']
+        start = int(NextToken or 0)
+        response = {
+            'Records': records[start:start + RESULT_PAGE_SIZE],
+            'TotalNumRows': len(records)
+        }
+        if start + RESULT_PAGE_SIZE < len(records):
+            response['NextToken'] = str(start + RESULT_PAGE_SIZE)
+        return response
+
+    def cancel_statement(self, Id):
+        self.backend.request('redshift-data', 'cancel_statement', can_fail=False)
+        with self._lock:
+            statement = self._statements[Id]
+            if statement['Status'] in ('SUBMITTED', 'STARTED'):
+                statement['Status'] = 'ABORTED'
+                return {'Status': True}
+        return {'Status': False}
+
+    def _submit(self, sqls, operation_name):
+        failed = self.backend.request('redshift-data', operation_name)
+        with self._lock:
+            statement_id = "statement-{0}".format(next(self._statement_ids))
+            self._statements[statement_id] = {
+                'Id': statement_id,
+                'Status': 'SUBMITTED',
+                'QueryString': ";\n".join(sqls),
+                'HasResultSet': False,
+                'ResultRows': -1,
+                'Records': []
+            }
+        threading.Thread(target=self._run, args=(statement_id, sqls, failed), daemon=True).start()
+        return {'Id': statement_id}
+
+    def _run(self, statement_id, sqls, failed):
+        with self._lock:
+            if self._statements[statement_id]['Status'] == 'ABORTED':
+                return
+            self._statements[statement_id]['Status'] = 'STARTED'
+        time.sleep(self.backend.statement_time * len(sqls))
+        start = time.perf_counter()
+        sub_statements = [
+            {'Id': "{0}:{1}".format(statement_id, number + 1), 'QueryString': sql,
+             'Status': 'SUBMITTED', 'ResultRows': -1, 'HasResultSet': False}
+            for number, sql in enumerate(sqls)
+        ]
+        records = []
+        error = None
+        with self._database_lock:
+            try:
+                if failed:
+                    raise Exception("Injected failure")
+                for sql in sqls:
+                    self._attach_schemas(sql)
+                self._connection.execute("BEGIN")
+                for sub_statement in sub_statements:
+                    rows, records = self._execute(sub_statement['QueryString'])
+                    sub_statement.update({
+                        'Status': 'FINISHED',
+                        'ResultRows': rows,
+                        'HasResultSet': records is not None
+                    })
+                with self._lock:
+                    aborted = self._statements[statement_id]['Status'] == 'ABORTED'
+                if aborted:
+                    raise Exception("Statement cancelled")
+                self._connection.execute("COMMIT")
+            except Exception as e:
+                if self._connection.in_transaction:
+                    self._connection.execute("ROLLBACK")
+                error = str(e)
+        with self._lock:
+            statement = self._statements[statement_id]
+            if statement['Status'] == 'ABORTED':
+                return
+            statement['Duration'] = int((time.perf_counter() - start) * 1000000000)
+            if error:
+                statement['Status'] = 'FAILED'
+                statement['Error'] = "ERROR: " + error
+                for sub_statement in sub_statements:
+                    if sub_statement['Status'] != 'FINISHED':
+                        sub_statement['Status'] = 'FAILED'
+                        break
+            else:
+                statement['Status'] = 'FINISHED'
+                statement['HasResultSet'] = records is not None
+                statement['ResultRows'] = sub_statements[-1]['ResultRows']
+                statement['Records'] = records or []
+            if len(sqls) > 1:
+                statement['SubStatements'] = sub_statements
+
+    def _attach_schemas(self, sql):
+        """Attaches a database file for each schema of the tables of a statement.
+        They cannot be attached inside a transaction.
+
+        :param sql: SQL statement
+        """
+        for schema in re.findall(r"\b(?:TABLE|INTO|FROM|LIKE|USING|COPY)\s+(?:IF EXISTS\s+)?"
+                                 r"([A-Za-z_]\w*)\.[A-Za-z_]\w*", sql, re.IGNORECASE):
+            if schema.lower() not in self._schemas and schema.lower() not in ('main', 'temp'):
+                self._connection.execute(
+                    "ATTACH DATABASE ? AS {0}".format(schema),
+                    (os.path.join(self.backend.directory, schema.lower() + ".sqlite"),)
+                )
+                self._schemas.add(schema.lower())
+
+    def _execute(self, sql):
+        """Executes a Redshift statement
+
+        :param sql: SQL statement
+        :return: Tuple with the number of rows loaded, affected or returned (-1 if not
+                 applicable) and the records in the Data API format (None if there is
+                 no result set)
+        """
+        sql = sql.strip().rstrip(';')
+        if re.match(r"COPY\s", sql, re.IGNORECASE):
+            rows = self._copy(sql)
+            self.loaded_rows = rows
+            return rows, None
+        if 'stv_slices' in sql:
+            return 1, [[{'longValue': self.backend.slices}]]
+
+        cursor = self._connection.execute(translate_statement(sql))
+        if cursor.description is None:
+            return cursor.rowcount, None
+        records = [[get_field(value) for value in row] for row in cursor.fetchall()]
+        return len(records), records
+
+    def _copy(self, sql):
+        """Loads the files of a COPY statement into its table
+
+        :param sql: COPY statement, see geo2rs.get_copy_statement()
+        :return: Number of rows loaded
+        """
+        match = re.match(r"COPY\s+(\S+)\s+FROM\s+'([^']+)'", sql, re.IGNORECASE)
+        table_name, url = match.groups()
+        s3_client = self.backend.client('s3')
+        files = [s3_client.get_url_path(url)]
+        if re.search(r"\sMANIFEST\s", sql):
+            with open(files[0]) as file:
+                files = [s3_client.get_url_path(entry['url'])
+                         for entry in json.load(file)['entries']]
+        elif not os.path.exists(files[0]):
+            # A prefix loads all the objects whose keys start with it
+            directory, prefix = os.path.split(files[0])
+            files = sorted(
+                os.path.join(directory, name) for name in os.listdir(directory)
+                if name.startswith(prefix)
+            ) if os.path.isdir(directory) else []
+        if not files:
+            raise Exception("The specified S3 prefix '{0}' does not exist".format(url))
+
+        rows = 0
+        for file_name in files:
+            for batch in read_copy_rows(file_name, sql):
+                if batch:
+                    self._connection.executemany(
+                        "INSERT INTO {0} VALUES ({1})".format(
+                            table_name,
+                            ", ".join("?" * len(batch[0]))
+                        ),
+                        batch
+                    )
+                    rows += len(batch)
+        return rows
+
+def translate_statement(sql):
+    """Translates the Redshift statements written by geo2rs to SQLite
+
+    :param sql: Redshift SQL statement
+    :return: SQLite SQL statement
+    """
+    if re.match(r"CREATE\s+TABLE\s", sql, re.IGNORECASE):
+        # The table attributes and compression encodings do not exist in SQLite.
+        # The EWKB hex strings must not be converted to numbers
+        sql = re.sub(r"\s+ENCODE\s+\w+", "", sql, flags=re.IGNORECASE)
+        sql = re.sub(r"\s+DISTSTYLE\s+\w+|\s+DISTKEY\s*\([^)]*\)|"
+                     r"\s+(?:COMPOUND\s+|INTERLEAVED\s+)?SORTKEY\s*\([^)]*\)",
+                     "", sql, flags=re.IGNORECASE)
+        return re.sub(r"\bGEOMETRY\b", "TEXT", sql, flags=re.IGNORECASE)
+    match = re.match(r"CREATE\s+TEMP(?:ORARY)?\s+TABLE\s+(\S+)\s*\(\s*LIKE\s+(\S+?)\s*\)$",
+                     sql, re.IGNORECASE)
+    if match:
+        return "CREATE TEMP TABLE {0} AS SELECT * FROM {1} WHERE 0".format(*match.groups())
+    match = re.match(r"DELETE\s+FROM\s+(\S+)\s+USING\s+(\S+)\s+WHERE\s+\1\.(\w+)\s*=\s*\2\.\3$",
+                     sql, re.IGNORECASE)
+    if match:
+        return "DELETE FROM {0} WHERE {2} IN (SELECT {2} FROM {1})".format(*match.groups())
+    return sql
+
+def read_copy_rows(file_name, sql, batch_size=10000):
+    """Reads the rows of a file loaded by COPY
+
+    :param file_name: Local path of the file
+    :param sql: COPY statement, with the format options
+    :param batch_size: Number of rows of each batch
+    :return: Generator of lists of row tuples
+    """
+    if re.search(r"FORMAT\s+AS\s+PARQUET", sql, re.IGNORECASE):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(file_name).iter_batches(batch_size):
+            columns = [
+                [get_sqlite_value(value) for value in column.to_pylist()]
+                for column in batch.columns
+            ]
+            yield list(zip(*columns))
+        return
+
+    compression = next(
+        (name for name in ('GZIP', 'ZSTD', 'BZIP2')
+         if re.search(r"\s{0}\s".format(name), sql)),
+        None
+    )
+    # The EWKB of a geometry can be up to 2 MB in hex
+    csv.field_size_limit(2 ** 31 - 1)
+    with open_compressed(file_name, compression) as file:
+        reader = csv.reader(file)
+        if re.search(r"IGNOREHEADER\s+1", sql):
+            next(reader, None)
+        while True:
+            batch = [
+                # Empty unquoted values are loaded as NULL
+                tuple(value if value != "" else None for value in row)
+                for row in itertools.islice(reader, batch_size)
+            ]
+            if not batch:
+                break
+            yield batch
+
+def open_compressed(file_name, compression=None):
+    """Opens a text file written by geo2rs.open_output()
+
+    :param file_name: Path of the file
+    :param compression: "GZIP", "ZSTD" or "BZIP2". By default, not compressed
+    :return: Text file object
+    """
+    if compression == "GZIP":
+        return gzip.open(file_name, "rt", newline="")
+    if compression == "BZIP2":
+        return bz2.open(file_name, "rt", newline="")
+    if compression == "ZSTD":
+        import zstandard
+        return zstandard.open(file_name, "rt", newline="")
+    return open(file_name, newline="")
+
+def get_sqlite_value(value):
+    """Converts a value read from Parquet to a value stored by SQLite
+
+    :param value: Python value
+    :return: Value
+    """
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+def get_field(value):
+    """Converts a value to a field of a Data API record
+
+    :param value: SQLite value
+    :return: Field dictionary
+    """
+    if value is None:
+        return {'isNull': True}
+    if isinstance(value, bool):
+        return {'booleanValue': value}
+    if isinstance(value, int):
+        return {'longValue': value}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    if isinstance(value, bytes):
+        return {'blobValue': value}
+    return {'stringValue': str(value)}
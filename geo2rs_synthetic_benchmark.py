@@ -0,0 +1,372 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import time
+from collections import OrderedDict
+
+import fiona
+import shapely
+
+import geo2rs
+import geo2rs_benchmark
+from geo2rs_local import LocalBackend
+
+# Kinds of synthetic datasets, see generate_dataset()
+DATASET_KINDS = ('points', 'lines', 'polygons', 'wide')
+
+# OGR drivers of the synthetic input files by extension
+DATASET_DRIVERS = OrderedDict([
+    ('shp', 'ESRI Shapefile'),
+    ('gpkg', 'GPKG'),
+    ('geojson', 'GeoJSON')
+])
+
+def generate_dataset(output_file, kind="points", feature_count=100000, vertices=1000, fields=50,
+                     seed=0, extent=(-180.0, -90.0, 180.0, 90.0), chunk_size=10000):
+    """Writes a synthetic geospatial file. The same arguments always produce the same features.
+
+    :param output_file: Path of the file to write. The driver is chosen by its extension,
+                        see DATASET_DRIVERS
+    :param kind: "points", "lines" (random walks of vertices vertices), "polygons"
+                 (star-shaped rings of vertices vertices) or "wide" (points with
+                 fields properties of mixed types)
+    :param feature_count: Number of features
+    :param vertices: Number of vertices of each line or polygon
+    :param fields: Number of properties of the wide datasets
+    :param seed: Seed of the random generator
+    :param extent: (minx, miny, maxx, maxy) extent of the features
+    :param chunk_size: Number of features written at a time
+    :return: Path of the written file
+    """
+    driver = DATASET_DRIVERS[os.path.splitext(output_file)[1].lstrip('.').lower()]
+    generator = random.Random(seed)
+    geometry_type = {'lines': 'LineString', 'polygons': 'Polygon'}.get(kind, 'Point')
+    schema = {'geometry': geometry_type, 'properties': get_dataset_properties(kind, fields)}
+    if os.path.exists(output_file):
+        fiona.remove(output_file, driver=driver)
+    features = (
+        {
+            'geometry': get_synthetic_geometry(generator, kind, vertices, extent),
+            'properties': get_synthetic_properties(generator, schema['properties'], id)
+        }
+        for id in range(feature_count)
+    )
+    with fiona.open(output_file, "w", driver=driver, schema=schema, crs="EPSG:4326") as sink:
+        while True:
+            chunk = list(itertools.islice(features, chunk_size))
+            if not chunk:
+                break
+            sink.writerecords(chunk)
+    return output_file
+
+def get_dataset_properties(kind, fields=50):
+    """Gets the Fiona schema properties of a synthetic dataset
+
+    :param kind: Kind of dataset, see generate_dataset()
+    :param fields: Number of properties of the wide datasets
+    :return: Dictionary with the type of each property
+    """
+    properties = OrderedDict([
+        ('id', 'int'),
+        ('name', 'str:32'),
+        ('value', 'float'),
+        ('created', 'date')
+    ])
+    if kind == 'wide':
+        # Short names, so they fit in the 10 characters of the Shapefile fields
+        types = ('int', 'float', 'str:24', 'date')
+        for number in range(len(properties), fields):
+            properties['f{0:03d}'.format(number)] = types[number % len(types)]
+    return properties
+
+def get_synthetic_geometry(generator, kind, vertices, extent):
+    """Generates a random GeoJSON-like geometry
+
+    :param generator: random.Random instance
+    :param kind: Kind of dataset, see generate_dataset()
+    :param vertices: Number of vertices of lines and polygons
+    :param extent: (minx, miny, maxx, maxy) extent of the geometry
+    :return: Geometry dictionary
+    """
+    minx, miny, maxx, maxy = extent
+    x = generator.uniform(minx, maxx)
+    y = generator.uniform(miny, maxy)
+    if kind == 'lines':
+        step = (maxx - minx) / 100000.0
+        coordinates = [(x, y)]
+        for _ in range(vertices - 1):
+            x = min(maxx, max(minx, x + generator.uniform(-step, step)))
+            y = min(maxy, max(miny, y + generator.uniform(-step, step)))
+            coordinates.append((x, y))
+        return {'type': 'LineString', 'coordinates': coordinates}
+    if kind == 'polygons':
+        # The vertices are sorted by angle around the center, so the ring is always simple
+        radius = (maxx - minx) / 20000.0
+        angles = sorted(generator.uniform(0, 2 * math.pi) for _ in range(vertices))
+        # Each vertex is on the ray at its angle, at a random fraction of the radius
+        radii = [radius * generator.uniform(0.5, 1) for _ in angles]
+        ring = [
+            (
+                min(maxx, max(minx, x + math.cos(angle) * vertex_radius)),
+                min(maxy, max(miny, y + math.sin(angle) * vertex_radius))
+            )
+            for angle, vertex_radius in zip(angles, radii)
+        ]
+        return {'type': 'Polygon', 'coordinates': [ring + ring[:1]]}
+    return {'type': 'Point', 'coordinates': (x, y)}
+
+def get_synthetic_properties(generator, properties, id):
+    """Generates random property values
+
+    :param generator: random.Random instance
+    :param properties: Dictionary with the Fiona type of each property
+    :param id: Value of the id property
+    :return: Dictionary with the value of each property
+    """
+    values = {}
+    for name, property_type in properties.items():
+        base_type = property_type.split(':')[0]
+        if name == 'id':
+            values[name] = id
+        elif base_type == 'int':
+            values[name] = generator.randint(-1000000, 1000000)
+        elif base_type == 'float':
+            values[name] = generator.uniform(-1000, 1000)
+        elif base_type == 'date':
+            values[name] = "20{0:02d}-{1:02d}-{2:02d}".format(
+                generator.randint(0, 25),
+                generator.randint(1, 12),
+                generator.randint(1, 28)
+            )
+        else:
+            values[name] = "".join(
+                generator.choice("abcdefghijklmnopqrstuvwxyz ")
+                for _ in range(generator.randint(1, 20))
+            )
+    return values
+
+def benchmark_synthetic(work_dir, kinds=DATASET_KINDS, sizes=(10000,), extensions=("gpkg",),
+                        engine="fiona", workers=1, compression=None, output_format="csv",
+                        vertices=1000, fields=50, seed=0, keep_files=False, backend_options=None):
+    """Generates synthetic datasets and imports each one measuring the time spent in each
+    stage, with the local backend instead of S3 and the Redshift Data API 
+    (see geo2rs_local.LocalBackend). The transform runs as in a real import, while 
+    the upload and COPY times measure the orchestration, the local disk and SQLite, 
+    plus the latency injected by the backend.
+
+    :param work_dir: Directory where the datasets, the staged files and the S3 objects
+                     are written
+    :param kinds: Kinds of datasets, see generate_dataset()
+    :param sizes: Numbers of features
+    :param extensions: Formats of the datasets, see DATASET_DRIVERS
+    :param engine: Transform engine, "fiona" or "arrow"
+    :param workers: Number of transform processes
+    :param compression: Compression of the CSV files
+    :param output_format: "csv" or "parquet"
+    :param vertices: Number of vertices of each line or polygon
+    :param fields: Number of properties of the wide datasets
+    :param seed: Seed of the random generator
+    :param keep_files: If True, the datasets and staged files are not deleted
+    :param backend_options: Dictionary with the latency, bandwidth, statement_time, 
+                            throttle_rate and failure_rate of the local backend
+    :return: List with the results of each dataset
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    backend_directory = os.path.join(work_dir, "backend")
+    backend = LocalBackend(backend_directory, seed=seed, **(backend_options or {}))
+    geo2rs.configure_backend(backend)
+    results = []
+    try:
+        for kind, size, extension in itertools.product(kinds, sizes, extensions):
+            input_file = os.path.join(work_dir, "{0}_{1}.{2}".format(kind, size, extension))
+            start = time.perf_counter()
+            generate_dataset(input_file, kind, size, vertices, fields, seed)
+            generate_time = time.perf_counter() - start
+            try:
+                result = geo2rs_benchmark.run_import(
+                    input_file,
+                    "geo2rs-benchmark",
+                    "local",
+                    "dev",
+                    "local",
+                    "local",
+                    "{0}_{1}".format(kind, size),
+                    engine,
+                    workers,
+                    compression,
+                    output_format
+                )
+            finally:
+                geo2rs.execute_redshift_statement(
+                    "local", 
+                    "dev", 
+                    "local", 
+                    "DROP TABLE IF EXISTS {0}_{1};".format(kind, size)
+                )
+                if not keep_files:
+                    remove_dataset(input_file)
+            result = OrderedDict(
+                [('kind', kind), ('extension', extension), ('vertices', vertices), 
+                 ('fields', fields), ('engine', engine), ('workers', workers), 
+                 ('generate', generate_time)] + list(result.items())
+            )
+            result['features_per_second'] = result['features'] / result['transform']
+            result['upload_mb_per_second'] = result['bytes'] / 1024 / 1024 / result['upload']
+            result['loaded_rows'] = geo2rs.get_client('redshift-data').loaded_rows
+            result['requests'] = backend.get_stats()
+            backend.stats.clear()
+            results.append(result)
+    finally:
+        geo2rs.configure_backend(None)
+        if not keep_files:
+            shutil.rmtree(backend_directory, ignore_errors=True)
+    return results
+
+def remove_dataset(input_file):
+    """Deletes a synthetic dataset and the files staged by geo2rs for it
+
+    :param input_file: Path of the dataset
+    """
+    directory = os.path.dirname(input_file) or "."
+    stem = os.path.splitext(os.path.basename(input_file))[0]
+    for name in os.listdir(directory):
+        if name.startswith(stem + "."):
+            os.remove(os.path.join(directory, name))
+
+def get_environment():
+    """Gets the versions of the software used by the benchmark, stored with the results
+    so they can be compared between runs
+
+    :return: Dictionary with the versions
+    """
+    return OrderedDict([
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('cpus', os.cpu_count()),
+        ('fiona', fiona.__version__),
+        ('gdal', fiona.__gdal_version__),
+        ('shapely', shapely.__version__)
+    ])
+
+def get_result_key(result):
+    """Gets the key identifying the dataset and the import options of a result, 
+    used to match it with the same result of a baseline
+
+    :param result: Result of benchmark_synthetic()
+    :return: Tuple with the kind, features, extension, vertices, fields, format, 
+             engine and workers
+    """
+    return (result['kind'], result['features'], result['extension'], result['vertices'], 
+            result['fields'], result['format'], result['engine'], result['workers'])
+
+def compare_results(results, baseline, threshold=0.1, min_time=0.05):
+    """Compares the time of each stage with the results of a previous run
+
+    :param results: List of results of benchmark_synthetic()
+    :param baseline: List of results of a previous run
+    :param threshold: Relative increase of the time of a stage reported as a regression
+    :param min_time: Stages faster than this in seconds in both runs are not compared,
+                     their times are mostly noise
+    :return: List of dictionaries with the dataset, stage, baseline and current times
+             and ratio of the stages slower than the baseline by more than the threshold
+    """
+    baseline = {get_result_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        previous = baseline.get(get_result_key(result))
+        if not previous:
+            continue
+        for stage in ('transform', 'upload', 'load', 'total'):
+            if max(result[stage], previous[stage]) < min_time:
+                continue
+            ratio = result[stage] / previous[stage] if previous[stage] > 0 else 1.0
+            if ratio > 1 + threshold:
+                regressions.append(OrderedDict([
+                    ('dataset', "{0}_{1}.{2}".format(result['kind'], result['features'],
+                                                     result['extension'])),
+                    ('stage', stage),
+                    ('baseline', previous[stage]),
+                    ('current', result[stage]),
+                    ('ratio', ratio)
+                ]))
+    return regressions
+
+def print_synthetic_results(results):
+    """Prints the synthetic benchmark results as a table
+
+    :param results: List of results
+    """
+    print("{0:<24}{1:>10}{2:>12}{3:>12}{4:>12}{5:>12}{6:>12}{7:>14}".format(
+        "dataset", "MB", "transform", "upload", "load", "total", "features/s", "upload MB/s"))
+    for result in results:
+        print("{0:<24}{1:>10.1f}{2:>12.2f}{3:>12.2f}{4:>12.2f}{5:>12.2f}{6:>12.0f}{7:>14.1f}".format(
+            "{0}_{1}.{2}".format(result['kind'], result['features'], result['extension']),
+            result['bytes'] / 1024 / 1024,
+            result['transform'],
+            result['upload'],
+            result['load'],
+            result['total'],
+            result['features_per_second'],
+            result['upload_mb_per_second']
+        ))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of geo2rs.py with synthetic datasets and the local backend instead of S3 and the Redshift Data API")
+    parser.add_argument("work_dir", help="Directory where the datasets, the staged files and the S3 objects are written.")
+    parser.add_argument("--kinds", default=",".join(DATASET_KINDS), help="Comma separated kinds of datasets: points, lines, polygons and wide.")
+    parser.add_argument("--sizes", default="10000", help="Comma separated numbers of features of the datasets.")
+    parser.add_argument("--formats", default="gpkg", help="Comma separated formats of the datasets: shp, gpkg and geojson.")
+    parser.add_argument("--vertices", type=int, default=1000, help="Number of vertices of each line or polygon.")
+    parser.add_argument("--fields", type=int, default=50, help="Number of properties of the wide datasets.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator.")
+    parser.add_argument("--engine", choices=["fiona", "arrow"], default="fiona", help="Transform engine.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of transform processes.")
+    parser.add_argument("--compression", choices=["gzip", "zstd", "bzip2"], help="Compression of the CSV files.")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="Format of the staged files.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request of the local backend.")
+    parser.add_argument("--bandwidth", type=float, help="MB per second of each connection to the local S3. By default, unlimited.")
+    parser.add_argument("--statement-time", type=float, default=0.0, help="Seconds each statement runs in the local backend before it finishes.")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Probability of a request to the local backend being throttled.")
+    parser.add_argument("--keep-files", action="store_true", help="Do not delete the datasets and staged files.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="JSON file written by a previous run. The stages slower than in the baseline are reported and the exit code is 1.")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative increase of the time of a stage reported as a regression (default 0.1).")
+    args = parser.parse_args()
+
+    results = benchmark_synthetic(
+        args.work_dir,
+        args.kinds.split(","),
+        [int(size) for size in args.sizes.split(",")],
+        args.formats.split(","),
+        args.engine,
+        args.workers,
+        args.compression,
+        args.format,
+        args.vertices,
+        args.fields,
+        args.seed,
+        args.keep_files,
+        {
+            'latency': args.latency,
+            'bandwidth': args.bandwidth and args.bandwidth * 1024 * 1024,
+            'statement_time': args.statement_time,
+            'throttle_rate': args.throttle_rate
+        }
+    )
+    print_synthetic_results(results)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({'environment': get_environment(), 'results': results}, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare_results(results, json.load(file)['results'], args.threshold)
+        for regression in regressions:
+            print("Regression in {dataset} {stage}: {baseline:.2f} s -> {current:.2f} s "
+                  "({ratio:.2f}x)".format(**regression))
+        if regressions:
+            raise SystemExit(1)